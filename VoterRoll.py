@@ -4,21 +4,40 @@
 #          and identifies voters who moved out-of-state or out-of-country.
 
 # Standard library imports
+import argparse
+import json
+import logging
+import multiprocessing
 import os
+import queue
 import shutil
 import sys
+import threading
+import time
 import warnings
-from   typing import List
+from   concurrent.futures import ProcessPoolExecutor
+from   contextlib         import contextmanager
+from   datetime           import datetime, timezone
+from   typing             import Any, Dict, Iterator, List, Optional
 
 # Third-party imports
+import numpy  as np
 import pandas as pd
-from   openpyxl                 import load_workbook
-from   openpyxl.styles          import PatternFill
-from   openpyxl.utils.dataframe import dataframe_to_rows
-from   pandas                   import DataFrame
+from   pandas import DataFrame
 
 # Local application/library specific imports
-from utilities.loggerUtilVoterRoll import logger
+from utilities.atomicFile          import atomic_path
+from utilities.excelFormatter      import STREAM_ROWS, write_county_workbook
+from utilities.fileDiscovery       import NCOA_PATTERNS, VR_PATTERNS, check_date_patterns, county_files, latest_file, load_file_index, save_file_index, writing_into
+from utilities.instrumentation     import StageRecorder, enable_memory_tracing, stage, write_run_report
+from utilities.inputCache          import CACHE_MAX_BYTES, InputCache, file_fingerprint, log_cache_stats, merge_cache_stats, new_cache_stats
+from utilities.inputReader         import CACHED_FORMATS
+from utilities.loggerUtilVoterRoll import LOG_LEVEL, log_context, log_to_queue, logger, queueHandler, set_log_level, worker_log_queue
+from utilities.matchEngine         import NCOA_COLUMNS, VR_VOTER_ID_COL, VoterIdIndex, match_moved_voters
+from utilities.runState            import county_input_state, county_unchanged, load_run_state, output_fingerprints, save_run_state
+from utilities.statewideOutput     import build_statewide, previous_statewide_rows, statewide_summary, write_statewide
+from utilities.trendDiff           import delta_frame, diff_ids, load_snapshot, removed_voter_rows, save_snapshot, snapshot_path, trend_summary, voter_id_array
+from utilities.voterSchema         import SCHEMA_VERSION, conform_to_template, format_output_dates, read_ncoa_file, read_vr_file
 
 # suppress the warning "Workbook contains no default style, apply openpyxl's default"
 warnings.filterwarnings("ignore", category=UserWarning, module="openpyxl")
@@ -30,6 +49,12 @@ warnings.filterwarnings('ignore', category=FutureWarning, message='The behavior
 BASE_DIR                  = os.path.dirname(os.path.abspath(__file__))
 COLORADO_VOTERS_MOVED_DIR = os.path.join(BASE_DIR, "colorado_voters_moved")
 VOTERS_MOVED_FILE         = os.path.join(BASE_DIR, "voters_moved.xlsx")
+MANIFEST_FILE             = os.path.join(COLORADO_VOTERS_MOVED_DIR, "voters_moved_manifest.json")
+REPORT_FILE               = os.path.join(COLORADO_VOTERS_MOVED_DIR, "voters_moved_run_report.json")
+STATE_FILE                = os.path.join(COLORADO_VOTERS_MOVED_DIR, "voters_moved_state.json")
+INDEX_FILE                = os.path.join(COLORADO_VOTERS_MOVED_DIR, "voters_moved_file_index.json")
+TREND_DIR                 = os.path.join(COLORADO_VOTERS_MOVED_DIR, "trend")
+CACHE_DIR                 = os.path.join(BASE_DIR, ".voterroll_cache")
 
 # list of Colorado counties
 colorado_counties: List[str] = [
@@ -46,212 +71,481 @@ colorado_counties: List[str] = [
     "Sedgwick_57",   "Summit_18",     "Teller_24",   "Washington_53", "Weld_8",         "Yuma_38"
 ]
 
-# freeze first row in Excel file
-def freeze_first_row(file_path):
-    try:
-        wb = load_workbook(file_path)
-        ws = wb.active
-        ws.freeze_panes = ws['A2']
-        wb.save(file_path)
-    except Exception as e:
-        logger.error(f"ERROR: failed to freeze first row in {file_path}: {e}")
+# collect WARNING and above log records emitted by this thread while a county is processed
+class CountyLogCollector(logging.Handler):
+    def __init__(self, result: Dict[str, Any]) -> None:
+        super().__init__(level=logging.WARNING)
+        self.result = result
+        self.thread = threading.get_ident()
 
-# autofit columns in Excel file
-def autofit_columns(file_path):
-    try:
-        wb = load_workbook(file_path)
-        ws = wb.active
+    def emit(self, record: logging.LogRecord) -> None:
+        if record.thread != self.thread:
+            return
+        key = "errors" if record.levelno >= logging.ERROR else "warnings"
+        self.result[key].append(record.getMessage())
 
-        for column in ws.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(cell.value)
-                except:
-                    pass
-            adjusted_width = (max_length + 5)
-            ws.column_dimensions[column_letter].width = adjusted_width
-        
-        wb.save(file_path)
-    except Exception as e:
-        logger.error(f"ERROR: failed to autofit columns in {file_path}: {e}")
+# empty result dictionary for one county
+def new_county_result(sub_dir: str) -> Dict[str, Any]:
+    return {
+        "county":       sub_dir,
+        "status":       "ok",
+        "rows_matched": 0,
+        "ncoa_file":    None,
+        "vr_file":      None,
+        "output_file":  None,
+        "timings":      {},
+        "stages":       [],
+        "cache":        new_cache_stats(),
+        "warnings":     [],
+        "errors":       [],
+    }
+
+# one county moving through the load and finish phases: its result, stage recorder and, once loaded, its parsed inputs
+# the phases may run on different threads (see run_prefetched), but never at the same time
+class CountyJob:
+    def __init__(self, sub_dir: str) -> None:
+        self.sub_dir:      str                      = sub_dir
+        self.sub_dir_path: str                      = os.path.join(BASE_DIR, sub_dir)
+        self.result:       Dict[str, Any]           = new_county_result(sub_dir)
+        self.recorder:     StageRecorder            = StageRecorder(sub_dir)
+        self.done:         bool                     = False  # result is final: skipped, unchanged or failed while loading
+        self.input_state:  Optional[Dict[str, Any]] = None
+        self.ncoa_df:      Optional[DataFrame]      = None
+        self.vr_df:        Optional[DataFrame]      = None
+        self.elapsed:      float                    = 0.0
+
+    # run one phase in the current thread: collect its warnings and errors, record its stages and time it
+    # exceptions are recorded in the result instead of being raised
+    @contextmanager
+    def phase(self) -> Iterator[None]:
+        collector = CountyLogCollector(self.result)
+        logger.addHandler(collector)
+        start = time.perf_counter()
+        try:
+            with self.recorder, log_context(county=self.sub_dir):
+                yield
+        except Exception as e:
+            logger.error(f"ERROR: error during processing of {self.sub_dir}: {e}")
+            self.done = True
+        finally:
+            logger.removeHandler(collector)
+            self.elapsed += time.perf_counter() - start
+
+    # a job that failed outside phase(), e.g. on the prefetch thread; finish_county returns its error result as is
+    @classmethod
+    def failed(cls, sub_dir: str, error: str) -> "CountyJob":
+        job = cls(sub_dir)
+        logger.error(f"ERROR: error during processing of {sub_dir}: {error}")
+        job.result["errors"].append(error)
+        job.done = True
+        return job
+
+    # final result dictionary; the parsed inputs are released
+    def finish(self) -> Dict[str, Any]:
+        self.ncoa_df = self.vr_df = None
+        self.result["stages"]  = self.recorder.stages
+        self.result["timings"] = {**self.recorder.timings(), "total": round(self.elapsed, 3)}
+        if self.result["errors"]:
+            self.result["status"] = "error"
+        return self.result
+
+# load phase for one county directory: select the latest NCOA and VR files and parse them
+# files are selected by the dates in their names (ncoa_patterns, vr_patterns); previous_files is the county's entry in the file index,
+# reused without scanning the directory when nothing was added or removed, and result["file_index"] holds the entry to save
+# with a cache_dir, parsed NCOA and VR frames are cached there and unchanged inputs are not parsed again
+# with a template_fingerprint (incremental mode), the job is done here when previous_state shows its inputs and outputs are unchanged
+def load_county(sub_dir: str, cache_dir: Optional[str] = None, cache_max_bytes: int = CACHE_MAX_BYTES,
+                template_fingerprint: Optional[Dict[str, Any]] = None, previous_state: Optional[Dict[str, Any]] = None,
+                trace_memory: bool = False, previous_files: Optional[Dict[str, Any]] = None,
+                ncoa_patterns: List[str] = NCOA_PATTERNS, vr_patterns: List[str] = VR_PATTERNS) -> CountyJob:
+    job    = CountyJob(sub_dir)
+    result = job.result
+    if trace_memory:
+        enable_memory_tracing()
+    with job.phase():
+        if not os.path.isdir(job.sub_dir_path):
+            logger.warning(f"WARNING: {job.sub_dir_path} is not a valid directory.")
+            result["status"] = "skipped"
+            job.done = True
+            return job
+
+        # read typed inputs (Excel, CSV, Parquet or Feather); slow-to-parse formats go through the cache when one is configured
+        cache: Optional[InputCache] = None
+        if cache_dir:
+            cache       = InputCache(cache_dir, cache_max_bytes)
+            cache.stats = result["cache"]
+        def read_input(path: str, reader, **options: Any) -> DataFrame:
+            if cache is not None and path.lower().endswith(CACHED_FORMATS):
+                return cache.read(path, reader=reader, schema=SCHEMA_VERSION, **options)
+            return reader(path, **options)
+
+        # select the most recent NCOA and VR files
+        with stage("discover"):
+            files: Dict[str, Any] = county_files(job.sub_dir_path, previous_files, ncoa_patterns, vr_patterns)
+        result["file_index"]     = files
+        ncoa_file: Optional[str] = latest_file(files, "ncoa")
+        vr_file:   Optional[str] = latest_file(files, "vr")
+        result.update(ncoa_file=ncoa_file, vr_file=vr_file)
+        if not ncoa_file or not vr_file:
+            return job  # the finish phase writes the empty voters_moved file
+
+        # incremental mode: skip match and write when nothing this county depends on has changed
+        if template_fingerprint is not None:
+            with stage("fingerprint"):
+                job.input_state = county_input_state(job.sub_dir_path, ncoa_file, vr_file, template_fingerprint, previous_state)
+                unchanged       = county_unchanged(previous_state, job.input_state)
+            if unchanged:
+                logger.info(f"Skip {sub_dir}: inputs and outputs unchanged since the last run.")
+                result.update(status="unchanged", rows_matched=previous_state.get("rows_matched", 0),
+                              output_file=os.path.join(COLORADO_VOTERS_MOVED_DIR, f"{sub_dir}_voters_moved.xlsx"), state=previous_state)
+                job.done = True
+                return job
+
+        with stage("read_ncoa") as metrics:
+            job.ncoa_df = read_input(os.path.join(job.sub_dir_path, ncoa_file), read_ncoa_file, columns=NCOA_COLUMNS)
+            metrics["rows"] = len(job.ncoa_df)
+        logger.info(f"Processing NCOA file: {ncoa_file} in {sub_dir}")
+
+        with stage("read_vr") as metrics:
+            job.vr_df = read_input(os.path.join(job.sub_dir_path, vr_file), read_vr_file)
+            metrics["rows"] = len(job.vr_df)
+        logger.info(f"Processing voter roll (VR) file: {vr_file} in {sub_dir}")
+    return job
+
+# finish phase for a loaded county: match NCOA against VR and write the formatted output, starting from the voters_moved.xlsx template
+# returns a result dictionary for the run manifest; with an input state (incremental mode), result["state"] holds the record to save for the next run
+# keep_frame returns the county output frame in result["frame"] for the statewide dataset
+# with a trend_dir, matched voter ids are diffed against the previous run's snapshot there and a delta report is written next to the output
+def finish_county(job: CountyJob, template_df: DataFrame, stream_rows: int = STREAM_ROWS, keep_frame: bool = False,
+                  trend_dir: Optional[str] = None) -> Dict[str, Any]:
+    if job.done:
+        # an unchanged county in an incremental trend run has nothing added or removed: its delta report is rewritten empty
+        if trend_dir is not None and job.result["status"] == "unchanged":
+            with job.phase(), stage("write_delta", rows=0):
+                previous   = load_snapshot(snapshot_path(trend_dir, job.sub_dir))
+                voter_ids  = previous[0] if previous else np.array([], dtype="int64")
+                delta_file = os.path.join(COLORADO_VOTERS_MOVED_DIR, f"{job.sub_dir}_voters_moved_delta.xlsx")
+                write_county_workbook(delta_frame(template_df, voter_ids[:0], DataFrame()), delta_file, stream_rows=stream_rows)
+                job.result["trend"] = {**trend_summary(previous, voter_ids, voter_ids[:0], voter_ids[:0]), "delta_file": delta_file}
+        return job.finish()
+    sub_dir = job.sub_dir
+    result  = job.result
+    with job.phase():
+        # county output starts from the shared in-memory voters_moved.xlsx template
+        county_file: str     = os.path.join(job.sub_dir_path, f"{sub_dir}_voters_moved.xlsx")
+        county_df: DataFrame = template_df.copy()
+        logger.info(f"Processing: {os.path.basename(county_file)}")
+
+        if job.ncoa_df is None or job.vr_df is None:
+            logger.info(f"No {'NCOA' if not result['ncoa_file'] else 'voter roll (VR)'} file found in {sub_dir}.")
+            with writing_into(result.get("file_index"), job.sub_dir_path):
+                write_county_workbook(county_df, county_file, stream_rows=stream_rows)  # empty voters_moved file, as before
+            result["status"] = "skipped"
+            return job.finish()
+
+        # search for voters who moved out-of-state or out-of-country
+        with stage("match") as metrics:
+            index: VoterIdIndex         = VoterIdIndex(job.vr_df)
+            matching_records: DataFrame = match_moved_voters(job.ncoa_df, job.vr_df, index)
+            county_df = conform_to_template(county_df, matching_records)
+            metrics["rows"] = len(matching_records)
+
+        # trend mode: voters added and removed since the previous run; removed voters' rows come from the VR while it is loaded
+        if trend_dir is not None:
+            with stage("trend") as metrics:
+                snapshot_file  = snapshot_path(trend_dir, sub_dir)
+                previous       = load_snapshot(snapshot_file)
+                voter_ids      = voter_id_array(matching_records[VR_VOTER_ID_COL])
+                added, removed = diff_ids(previous[0], voter_ids) if previous else (voter_ids, voter_ids[:0])
+                removed_rows   = removed_voter_rows(index, removed)
+                metrics["rows"] = len(added) + len(removed)
+        index = job.ncoa_df = job.vr_df = None  # inputs are no longer needed; free them before formatting
+        result["rows_matched"] = len(matching_records)
+        logger.info(f"Matched {len(matching_records)} voter roll (VR) records in {sub_dir}")
+
+        with stage("sort_dates", rows=len(county_df)):
+            # sort by MAILING_STATE, then by MAILING_COUNTRY
+            county_df = county_df.sort_values(by=["MAILING_STATE", "MAILING_COUNTRY"])
+
+            # dates were parsed when the VR file was read; format them as MM/DD/YYYY once, for the output
+            county_df = format_output_dates(county_df)
+
+        # save the county file: one write with frozen header, autofit columns and row colors
+        with stage("write", rows=len(county_df)):
+            logger.info(f"Format {county_file}...")
+            with writing_into(result.get("file_index"), job.sub_dir_path):
+                write_county_workbook(county_df, county_file, stream_rows=stream_rows)
+
+        # copy county file from each county directory into colorado_voters_moved directory
+        with stage("copy_output"):
+            moved_county_file: str = os.path.join(COLORADO_VOTERS_MOVED_DIR, f"{sub_dir}_voters_moved.xlsx")
+            with atomic_path(moved_county_file) as tmp_path:
+                shutil.copy2(county_file, tmp_path)
+            result["output_file"] = moved_county_file
+            logger.info(f"Copy {moved_county_file} to colorado_voters_moved directory...")
+        if keep_frame:
+            result["frame"] = county_df
+
+        # delta report next to the full output; the snapshot is saved only once the outputs are written
+        if trend_dir is not None:
+            delta_df: DataFrame = delta_frame(county_df, added, removed_rows)
+            with stage("write_delta", rows=len(delta_df)):
+                delta_file: str = os.path.join(COLORADO_VOTERS_MOVED_DIR, f"{sub_dir}_voters_moved_delta.xlsx")
+                write_county_workbook(delta_df, delta_file, stream_rows=stream_rows)
+                save_snapshot(snapshot_file, voter_ids, result["ncoa_file"])
+            result["trend"] = {**trend_summary(previous, voter_ids, added, removed), "delta_file": delta_file}
+            logger.info(f"Trend for {sub_dir}: {len(added)} added, {len(removed)} removed since "
+                        f"{previous[1] if previous else 'no previous trend run'}")
+
+        # record what this output was built from, for the next incremental run
+        if job.input_state is not None:
+            result["state"] = {**job.input_state, "rows_matched": result["rows_matched"], "output_fingerprints": output_fingerprints(county_file, moved_county_file)}
+    return job.finish()
+
+# process one county directory: load phase then finish phase in the calling thread (and in each pool worker)
+def process_county(sub_dir: str, template_df: DataFrame, stream_rows: int = STREAM_ROWS, cache_dir: Optional[str] = None, cache_max_bytes: int = CACHE_MAX_BYTES,
+                   template_fingerprint: Optional[Dict[str, Any]] = None, previous_state: Optional[Dict[str, Any]] = None,
+                   trace_memory: bool = False, keep_frame: bool = False, previous_files: Optional[Dict[str, Any]] = None,
+                   ncoa_patterns: List[str] = NCOA_PATTERNS, vr_patterns: List[str] = VR_PATTERNS, trend_dir: Optional[str] = None) -> Dict[str, Any]:
+    job = load_county(sub_dir, cache_dir=cache_dir, cache_max_bytes=cache_max_bytes, template_fingerprint=template_fingerprint,
+                      previous_state=previous_state, trace_memory=trace_memory, previous_files=previous_files,
+                      ncoa_patterns=ncoa_patterns, vr_patterns=vr_patterns)
+    return finish_county(job, template_df, stream_rows=stream_rows, keep_frame=keep_frame, trend_dir=trend_dir)
+
+# next job from the prefetch queue; if the loader thread has stopped without queueing it, the county is reported as failed
+# instead of waiting forever
+def next_loaded_job(loaded: "queue.Queue[CountyJob]", loader_thread: threading.Thread, sub_dir: str) -> CountyJob:
+    while True:
+        try:
+            return loaded.get(timeout=1)
+        except queue.Empty:
+            if not loader_thread.is_alive() and loaded.empty():
+                return CountyJob.failed(sub_dir, "prefetch thread stopped before loading this county")
+
+# serial run with read-ahead: a background thread discovers and parses up to `prefetch` counties ahead
+# while this thread matches and writes, so disk reads and Excel parsing overlap matching and formatting
+# the bounded queue keeps at most prefetch + 2 counties' inputs in memory (queued, being loaded, being finished)
+# time this thread spends waiting for inputs is recorded as the prefetch_wait stage of run_recorder
+# previous maps each county to its load_county previous_state and previous_files
+def run_prefetched(counties: List[str], prefetch: int, template_df: DataFrame, run_recorder: StageRecorder, stream_rows: int = STREAM_ROWS,
+                   keep_frame: bool = False, previous: Optional[Dict[str, Dict[str, Any]]] = None, trend_dir: Optional[str] = None,
+                   **load_options: Any) -> List[Dict[str, Any]]:
+    previous = previous or {}
+    loaded: "queue.Queue[CountyJob]" = queue.Queue(maxsize=max(prefetch, 1))
 
-# color rows by voters who moved out-of-state or out-of-country
-def color_rows(file_path):
+    # a county that fails outside its load phase is queued as a failed job, so the loader always reaches the last county
+    def loader() -> None:
+        for sub_dir in counties:
+            try:
+                job = load_county(sub_dir, **previous.get(sub_dir, {}), **load_options)
+            except Exception as e:
+                job = CountyJob.failed(sub_dir, str(e))
+            loaded.put(job)
+
+    # daemon thread: an interrupted run does not hang on a full queue
+    loader_thread = threading.Thread(target=loader, name="county-prefetch", daemon=True)
+    loader_thread.start()
+    results: List[Dict[str, Any]] = []
+    for sub_dir in counties:
+        with run_recorder, run_recorder.stage("prefetch_wait"):
+            job = next_loaded_job(loaded, loader_thread, sub_dir)
+        results.append(finish_county(job, template_df, stream_rows=stream_rows, keep_frame=keep_frame, trend_dir=trend_dir))
+    return results
+
+# cache statistics summed over all counties
+def cache_totals(results: List[Dict[str, Any]]) -> Dict[str, int]:
+    totals = new_cache_stats()
+    for result in results:
+        merge_cache_stats(totals, result.get("cache", {}))
+    return totals
+
+# write the per-county run manifest as JSON
+# statewide is the statewide dataset summary, when one was built; trend totals are added when counties ran in trend mode
+def write_manifest(results: List[Dict[str, Any]], manifest_file: str = MANIFEST_FILE, statewide: Optional[Dict[str, Any]] = None) -> None:
+    summary: Dict[str, Any] = {
+        "counties":     len(results),
+        "ok":           sum(1 for r in results if r["status"] == "ok"),
+        "unchanged":    sum(1 for r in results if r["status"] == "unchanged"),
+        "skipped":      sum(1 for r in results if r["status"] == "skipped"),
+        "errors":       sum(1 for r in results if r["status"] == "error"),
+        "rows_matched": sum(r["rows_matched"] for r in results),
+        "cache":        cache_totals(results),
+    }
+    if statewide is not None:
+        summary["statewide"] = statewide
+    trends = [r["trend"] for r in results if "trend" in r]
+    if trends:
+        summary["trend"] = {"counties": len(trends), "added": sum(t["added"] for t in trends), "removed": sum(t["removed"] for t in trends)}
     try:
-        wb = load_workbook(file_path)
-        ws = wb.active
-
-        # fill styles for shades of grey - from light to dark
-        gainsboro_grey_fill  = PatternFill(start_color="DCDCDC", end_color="DCDCDC", fill_type="solid")
-        silver_grey_fill     = PatternFill(start_color="C0C0C0", end_color="C0C0C0", fill_type="solid")
-        dark_grey_fill       = PatternFill(start_color="A9A9A9", end_color="A9A9A9", fill_type="solid")
-
-        # Get the column indexes for MAILING_STATE and MAILING_COUNTRY
-        mailing_state_col   = None
-        mailing_country_col = None
-        for cell in ws[1]:  # Iterate over the first row to find the columns
-            if cell.value   == "MAILING_STATE":
-                mailing_state_col   = cell.column
-            elif cell.value == "MAILING_COUNTRY":
-                mailing_country_col = cell.column
-
-        if not mailing_state_col or not mailing_country_col:
-            logger.error("ERROR: MAILING_STATE or MAILING_COUNTRY column not found.")
-            sys.exit(1)
-
-        # Color rows based on MAILING_STATE and MAILING_COUNTRY
-        for row in ws.iter_rows(min_row=2, max_row=ws.max_row, min_col=1, max_col=ws.max_column):
-            mailing_state_value   = row[mailing_state_col   - 1].value
-            mailing_country_value = row[mailing_country_col - 1].value
-
-            if mailing_state_value:                                     # color rows for voters who moved out-of-state
-                for cell in row:
-                    cell.fill = gainsboro_grey_fill
-            elif mailing_country_value:                                 # color rows for voters who moved out-of-country
-                for cell in row:
-                    cell.fill = silver_grey_fill
-            elif not mailing_state_value and not mailing_country_value: # color rows where there are no values in MAILING_STATE or MAILING_COUNTRY
-                for cell in row:
-                    cell.fill = dark_grey_fill
-
-        wb.save(file_path)
+        with open(manifest_file, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "counties": results}, f, indent=2)
+        logger.info(f"Wrote run manifest {manifest_file}")
     except Exception as e:
-        logger.error(f"ERROR: failed to color rows in {file_path}: {e}")
+        logger.error(f"ERROR: failed to write run manifest {manifest_file}: {e}")
 
 # main
-def main() -> None:
+# workers > 1 processes counties in a process pool; results are returned in colorado_counties order
+# outputs with at least stream_rows rows are written with the streaming (write-only) Excel writer
+# cache_dir enables the parsed-input cache, bounded to cache_max_bytes
+# incremental skips counties whose inputs, template and outputs are unchanged since the run recorded in state_file
+# per-stage wall time, CPU time, memory and rows for every county are written to report_file; trace_memory adds per-stage peak memory
+# prefetch > 0 (serial runs only) parses up to prefetch counties ahead on a background thread
+# statewide builds the consolidated statewide dataset from the county frames, flagging VOTER_IDs matched in more than one county;
+# statewide_xlsx also writes it as one workbook with a sheet per county
+# the latest NCOA and VR files are selected by the dates ncoa_patterns and vr_patterns find in their names; the per-county file index is kept in index_file
+def main(workers: int = 1, stream_rows: int = STREAM_ROWS, cache_dir: Optional[str] = None, cache_max_bytes: int = CACHE_MAX_BYTES,
+         incremental: bool = False, state_file: str = STATE_FILE, report_file: str = REPORT_FILE, trace_memory: bool = False,
+         prefetch: int = 0, statewide: bool = False, statewide_xlsx: bool = False, index_file: str = INDEX_FILE,
+         ncoa_patterns: List[str] = NCOA_PATTERNS, vr_patterns: List[str] = VR_PATTERNS, trend: bool = False) -> List[Dict[str, Any]]:
+    # a bad file name date pattern stops the run here, rather than failing every county
+    check_date_patterns(list(ncoa_patterns) + list(vr_patterns))
+
     # check if voters_moved.xlsx exists in same directory as VoterRoll.py
     if not os.path.exists(VOTERS_MOVED_FILE):
         logger.error("ERROR: 'voters_moved.xlsx' file does not exist.")
         sys.exit(1)
-    
-    # Copy voters_moved.xlsx to each county directory
-    logger.info("Copy voters_moved.xlsx to Colorado county directories...")
-    try:
-        for sub_dir in colorado_counties:
-            sub_dir_path: str = os.path.join(BASE_DIR, sub_dir)
-            if not os.path.isdir(sub_dir_path):
-                logger.warning(f"WARNING: {sub_dir_path} is not a valid directory.")
-                continue
-            dest_path: str = os.path.join(BASE_DIR, sub_dir, "voters_moved.xlsx")
-            logger.debug(f"Copy voters_moved.xlsx to {dest_path}")
-            pd.read_excel(VOTERS_MOVED_FILE).to_excel(dest_path, index=False)
-    except Exception as e:
-        logger.error(f"ERROR: error copying voters_moved.xlsx file: {e}")
-        sys.exit(1)
-    
-    # Rename voters_moved.xlsx to county_name_voters_moved.xlsx
-    logger.info("Rename voters_moved.xlsx to county_name_voters_moved.xlsx...")
-    try:
-        for sub_dir in colorado_counties:
-            sub_dir_path: str = os.path.join(BASE_DIR, sub_dir)
-            if not os.path.isdir(sub_dir_path):
-                logger.warning(f"WARNING: {sub_dir_path} is not a valid directory.")
-                continue
-            old_path: str = os.path.join(sub_dir_path, "voters_moved.xlsx")
-            new_path: str = os.path.join(sub_dir_path, f"{sub_dir}_voters_moved.xlsx")
-            logger.debug(f"Rename {old_path} to {new_path}")
-            if os.path.exists(old_path):
-                if os.path.exists(new_path):
-                    os.remove(new_path)
-                os.rename(old_path, new_path)
-            else:
-                logger.warning(f"WARNING: file {old_path} does not exist.")
-    except Exception as e:
-        logger.error(f"ERROR: error renaming files: {e}")
-        sys.exit(1)
+
+    # create colorado_voters_moved directory once, before any worker copies into it
+    os.makedirs(COLORADO_VOTERS_MOVED_DIR, exist_ok=True)
+
+    run_started: str   = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    run_start:   float = time.perf_counter()
+    if trace_memory and prefetch > 0 and workers <= 1:
+        logger.warning("WARNING: --trace-memory is ignored with --prefetch; both threads would reset the same process-wide peak.")
+        trace_memory = False
+    if trace_memory:
+        enable_memory_tracing()
+    run_recorder = StageRecorder("statewide")
+
+    # load voters_moved.xlsx once; every county and worker starts from this in-memory template
+    logger.info("Load voters_moved.xlsx template...")
+    with run_recorder, run_recorder.stage("load_template"):
+        template_df: DataFrame = pd.read_excel(VOTERS_MOVED_FILE)
 
     # process each county directory
-    logger.info("Process Colorado county directories...")
-    try:
+    logger.info(f"Process Colorado county directories with {workers} worker(s)...")
+    results: List[Dict[str, Any]] = []
+    county_options: Dict[str, Any] = {"template_df": template_df, "stream_rows": stream_rows, "cache_dir": cache_dir, "cache_max_bytes": cache_max_bytes,
+                                      "trace_memory": trace_memory, "keep_frame": statewide, "ncoa_patterns": ncoa_patterns, "vr_patterns": vr_patterns,
+                                      "trend_dir": TREND_DIR if trend else None}
+    run_state:      Dict[str, Dict[str, Any]] = {}
+    if incremental:
+        run_state = load_run_state(state_file)
+        county_options["template_fingerprint"] = file_fingerprint(VOTERS_MOVED_FILE)
+    file_index: Dict[str, Dict[str, Any]] = load_file_index(index_file)
+    previous:   Dict[str, Dict[str, Any]] = {sub_dir: {"previous_state": run_state.get(sub_dir), "previous_files": file_index.get(sub_dir)} for sub_dir in colorado_counties}
+    # trend runs diff against each county's snapshot; a county without one is reprocessed even when its inputs are unchanged
+    if trend:
         for sub_dir in colorado_counties:
-            sub_dir_path: str = os.path.join(BASE_DIR, sub_dir)
-            if not os.path.isdir(sub_dir_path):
-                logger.warning(f"WARNING: {sub_dir_path} is not a valid directory.")
-                continue
-            
-            # Add _voters_moved.xlsx suffix to county file
-            county_file: str = os.path.join(sub_dir_path, f"{sub_dir}_voters_moved.xlsx")
-            if not os.path.exists(county_file):
-                logger.warning(f"File {county_file} does not exist.")
-                continue
-            county_df: DataFrame = pd.read_excel(county_file)
-            logger.info(f"Processing: {os.path.basename(county_file)}")
-
-            # search for NCOA file in county directory
-            ncoa_files: List[str] = [f for f in os.listdir(sub_dir_path) if 'NCOA' in f and f.endswith('.xlsx')]
-            if not ncoa_files:
-                logger.info(f"No NCOA file found in {sub_dir}.")
-                continue
-
-            # Sort the NCOA files by date and select the most recent one
-            ncoa_files.sort(reverse=True, key=lambda x: x[:8])  # Sort by the date part of the filename
-            ncoa_file: str = ncoa_files[0]
-            ncoa_df: DataFrame = pd.read_excel(os.path.join(sub_dir_path, ncoa_file))
-            logger.info(f"Processing NCOA file: {ncoa_file} in {sub_dir}")
-            
-            # search for voter roll (VR) file in county directory
-            vr_files: List[str] = [f for f in os.listdir(sub_dir_path) if f.startswith('VR') and f.endswith('.xlsx')]
-            if not vr_files:
-                logger.info(f"No voter roll (VR) file found in {sub_dir}.")
-                continue
-
-            # Sort the VR files by date and select the most recent one
-            vr_files.sort(reverse=True, key=lambda x: x[2:9])  # Sort by the date part of the filename
-            vr_file: str = vr_files[0]
-            vr_df: DataFrame = pd.read_excel(os.path.join(sub_dir_path, vr_file))
-            logger.info(f"Processing voter roll (VR) file: {vr_file} in {sub_dir}")
-
-            # search for voters who moved out-of-state or out-of-country
-            for _, row in ncoa_df.iterrows():
-                if row['NEW State'] != 'CO':
-                    voter_id: int = row['VoterID']
-                    matching_record: DataFrame = vr_df[vr_df['VOTER_ID'] == voter_id]
-                    county_df = pd.concat([county_df, matching_record], ignore_index=True)
-            
-            # sort by MAILING_STATE, then by MAILING_COUNTRY
-            county_df = county_df.sort_values(by=["MAILING_STATE", "MAILING_COUNTRY"])
+            if not os.path.exists(snapshot_path(TREND_DIR, sub_dir)):
+                previous[sub_dir]["previous_state"] = None
+    if workers > 1 and prefetch > 0:
+        logger.warning("WARNING: --prefetch applies to serial runs; ignored with more than one worker.")
+    if workers <= 1 and prefetch > 0:
+        load_options = {key: value for key, value in county_options.items() if key not in ("template_df", "stream_rows", "keep_frame", "trend_dir")}
+        results = run_prefetched(colorado_counties, prefetch, template_df, run_recorder, stream_rows=stream_rows, keep_frame=statewide,
+                                 previous=previous, trend_dir=county_options["trend_dir"], **load_options)
+    elif workers <= 1:
+        for sub_dir in colorado_counties:
+            results.append(process_county(sub_dir, **previous[sub_dir], **county_options))
+    else:
+        # workers log through a queue to a listener in this process, so their records are written whole and in one place
+        with worker_log_queue() as log_queue, ProcessPoolExecutor(max_workers=workers, initializer=log_to_queue,
+                                                                  initargs=(log_queue, queueHandler.level)) as executor:
+            futures = {sub_dir: executor.submit(process_county, sub_dir, **previous[sub_dir], **county_options) for sub_dir in colorado_counties}
+            for sub_dir, future in futures.items():
+                try:
+                    results.append(future.result())
+                except Exception as e:  # worker process died, e.g. out of memory
+                    logger.error(f"ERROR: worker failed while processing {sub_dir}: {e}")
+                    result = new_county_result(sub_dir)
+                    result.update(status="error", errors=[str(e)])
+                    results.append(result)
 
-            # format date columns to YYYY-MM-DD without time
-            county_df['EFFECTIVE_DATE']         = pd.to_datetime(county_df['EFFECTIVE_DATE']).dt.strftime('%m/%d/%Y')
-            county_df['REGISTRATION_DATE']      = pd.to_datetime(county_df['REGISTRATION_DATE']).dt.strftime('%m/%d/%Y')
-            county_df['PARTY_AFFILIATION_DATE'] = pd.to_datetime(county_df['PARTY_AFFILIATION_DATE']).dt.strftime('%m/%d/%Y')
+    for result in results:
+        if result["status"] == "error":
+            logger.error(f"ERROR: {result['county']} failed: {'; '.join(result['errors'])}")
+    if cache_dir:
+        log_cache_stats(cache_totals(results), cache_dir)
 
-            # save the county file
-            county_df.to_excel(county_file, index=False)
+    # file index entries of counties that failed before discovery are kept from the previous run
+    file_index.update({r["county"]: r.pop("file_index") for r in results if "file_index" in r})
+    save_file_index(file_index, index_file)
 
-            # copy county file from each county directory into colorado_voters_moved directory
-            if not os.path.exists(COLORADO_VOTERS_MOVED_DIR): # Check if COLORADO_VOTERS_MOVED_DIR exists. If not, create it.
-                os.makedirs(COLORADO_VOTERS_MOVED_DIR)
-            moved_county_file: str = os.path.join(COLORADO_VOTERS_MOVED_DIR, f"{sub_dir}_voters_moved.xlsx")
-            shutil.copy2(county_file, moved_county_file)
-            logger.info(f"Copy {moved_county_file} to colorado_voters_moved directory...")
+    # keep state only for counties that produced an output; errors and skips are retried next run
+    if incremental:
+        save_run_state({r["county"]: r["state"] for r in results if r.get("state")}, state_file)
+        logger.info(f"Incremental run: {sum(1 for r in results if r['status'] == 'unchanged')} unchanged counties skipped.")
 
-            # format Excel file
-            logger.info(f"Format {moved_county_file}...")
-            try:
-                # TODO: 
-                # open and save file to ensure it's in correct format
-                # apparently, there are incompatibilities between Excel and LibreOffice Calc
-                # need to check if these two lines are necessary
-                df = pd.read_excel(moved_county_file)
-                df.to_excel(moved_county_file, index=False)
-
-                freeze_first_row(moved_county_file)
-                autofit_columns (moved_county_file)
-                color_rows      (moved_county_file)
-            except Exception as e:
-                logger.error(f"ERROR: failed to format {moved_county_file}: {e}")
+    # statewide dataset from the in-memory county frames; outputs are never re-read
+    county_frames:     Dict[str, DataFrame]     = {r["county"]: r.pop("frame") for r in results if "frame" in r}
+    statewide_info:    Optional[Dict[str, Any]] = None
+    if statewide:
+        try:
+            with run_recorder, run_recorder.stage("statewide_output"):
+                unchanged = [r["county"] for r in results if r["status"] == "unchanged"]
+                county_frames.update(previous_statewide_rows(COLORADO_VOTERS_MOVED_DIR, unchanged))
+                statewide_df: DataFrame = build_statewide({c: county_frames[c] for c in colorado_counties if c in county_frames})
+                statewide_files = write_statewide(statewide_df, COLORADO_VOTERS_MOVED_DIR, xlsx=statewide_xlsx)
+            statewide_info = statewide_summary(statewide_df, statewide_files)
+        except Exception as e:
+            logger.error(f"ERROR: failed to write the statewide dataset: {e}")
+            statewide_info = {"error": str(e)}
 
-    except Exception as e:
-        logger.error(f"ERROR: error during processing of county directories: {e}")
-        sys.exit(1)
+    # stage metrics go to the run report; the manifest keeps per-county results and wall timings
+    stages: List[Dict[str, Any]] = run_recorder.stages + [metrics for result in results for metrics in result.pop("stages", [])]
+    write_manifest(results, statewide=statewide_info)
+    write_run_report(report_file, {
+        "started":      run_started,
+        "wall_s":       round(time.perf_counter() - run_start, 3),
+        "workers":      workers,
+        "prefetch":     prefetch if workers <= 1 else 0,
+        "incremental":  incremental,
+        "cache":        bool(cache_dir),
+        "trace_memory": trace_memory,
+        "statewide":    statewide,
+        "trend":        trend,
+        "counties":     len(results),
+        "rows_matched": sum(r["rows_matched"] for r in results),
+    }, stages)
+    return results
+
+# command line arguments
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Identify Colorado voters who moved out-of-state or out-of-country.")
+    parser.add_argument("--workers",        type=int, default=1,                             help="number of counties to process in parallel (default: 1)")
+    parser.add_argument("--stream-rows",    type=int, default=STREAM_ROWS,                   help=f"write outputs with at least this many rows in streaming write-only mode; 0 always streams (default: {STREAM_ROWS})")
+    parser.add_argument("--cache-dir",                default=CACHE_DIR,                     help=f"directory for cached parsed NCOA and VR inputs (default: {CACHE_DIR})")
+    parser.add_argument("--cache-max-mb",   type=int, default=CACHE_MAX_BYTES // 1024 ** 2,  help="cache size limit in MB; least recently used entries are evicted first")
+    parser.add_argument("--no-cache",                 action="store_true",                   help="always parse NCOA and VR inputs")
+    parser.add_argument("--incremental",              action="store_true",                   help="only reprocess counties whose NCOA/VR inputs, template or outputs changed since the last incremental run")
+    parser.add_argument("--prefetch",       type=int, default=0,                             help="with one worker, parse up to this many counties ahead on a background thread while the current county is matched and written (default: 0, off)")
+    parser.add_argument("--statewide",                action="store_true",                   help="also write a statewide dataset (CSV, plus Parquet when pyarrow is installed) flagging VOTER_IDs matched in more than one county")
+    parser.add_argument("--statewide-xlsx",           action="store_true",                   help="with --statewide, also write the statewide dataset as one workbook with a sheet per county")
+    parser.add_argument("--trend",                    action="store_true",                   help="compare each county's matched VOTER_IDs with the previous trend run and write a delta report of added and removed voters")
+    parser.add_argument("--ncoa-pattern",             action="append",                       help="regular expression with year, month and optional day groups for NCOA file name dates; repeat to try several (default: built-in NCOA layouts)")
+    parser.add_argument("--vr-pattern",               action="append",                       help="same, for voter roll (VR) file names (default: built-in VR layouts)")
+    parser.add_argument("--report",                   default=REPORT_FILE,                   help=f"JSON run report with per-stage timings and memory (default: {REPORT_FILE})")
+    parser.add_argument("--log-level",      type=str.upper, default=LOG_LEVEL,  choices=["DEBUG", "INFO", "WARNING", "ERROR"], help=f"log level of the console and log file (default: {LOG_LEVEL}; set VOTERROLL_LOG_LEVEL to change it)")
+    parser.add_argument("--trace-memory",             action="store_true",                   help="record per-stage peak Python memory in the run report (slower)")
+    args = parser.parse_args(argv)
+    try:
+        check_date_patterns((args.ncoa_pattern or []) + (args.vr_pattern or []))
+    except ValueError as e:
+        parser.error(str(e))
+    return args
 
 # main entry point
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # required for process pools in a pyinstaller .exe
+    args = parse_args()
+    set_log_level(args.log_level)
     logger.info("Starting VoterRoll...")
-    main()
-    logger.info("Finished VoterRoll.")
\ No newline at end of file
+    results = main(workers=args.workers, stream_rows=args.stream_rows,
+                   cache_dir=None if args.no_cache else args.cache_dir, cache_max_bytes=args.cache_max_mb * 1024 ** 2,
+                   incremental=args.incremental, report_file=args.report, trace_memory=args.trace_memory, prefetch=args.prefetch,
+                   statewide=args.statewide or args.statewide_xlsx, statewide_xlsx=args.statewide_xlsx,
+                   ncoa_patterns=args.ncoa_pattern or NCOA_PATTERNS, vr_patterns=args.vr_pattern or VR_PATTERNS, trend=args.trend)
+    logger.info("Finished VoterRoll.")
+    if any(result["status"] == "error" for result in results):
+        sys.exit(1)
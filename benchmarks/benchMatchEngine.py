@@ -0,0 +1,68 @@
+# Purpose: benchmark the NCOA-to-voter-roll match engine against the legacy per-row loop
+#          and show that match time grows near-linearly with voter roll (VR) size.
+#
+# Usage:   python benchmarks/benchMatchEngine.py [--sizes 10000 50000 ...] [--ncoa-ratio 0.1] [--legacy-max 20000]
+
+# Standard library imports
+import argparse
+import os
+import sys
+import time
+from   typing import List, Optional
+
+# Third-party imports
+import numpy  as np
+import pandas as pd
+from   pandas import DataFrame
+
+# make the project root importable when run as a script
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.syntheticData import make_ncoa, make_voter_roll # noqa: E402
+from utilities.matchEngine    import match_moved_voters        # noqa: E402
+
+# the original iterrows/concat loop from VoterRoll.main()
+def legacy_match(ncoa_df: DataFrame, vr_df: DataFrame) -> DataFrame:
+    county_df = vr_df.iloc[0:0]
+    for _, row in ncoa_df.iterrows():
+        if row["NEW State"] != "CO":
+            voter_id = row["VoterID"]
+            matching_record = vr_df[vr_df["VOTER_ID"] == voter_id]
+            county_df = pd.concat([county_df, matching_record], ignore_index=True)
+    return county_df
+
+# best-of-repeat wall time in seconds
+def time_call(func, *args, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the VoterRoll match engine.")
+    parser.add_argument("--sizes",      type=int,   nargs="+", default=[10000, 50000, 100000, 200000, 400000], help="voter roll sizes (rows)")
+    parser.add_argument("--ncoa-ratio", type=float, default=0.1,   help="NCOA rows as a fraction of VR rows")
+    parser.add_argument("--legacy-max", type=int,   default=20000, help="largest VR size to time the legacy loop on")
+    parser.add_argument("--seed",       type=int,   default=7)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    print(f"{'VR rows':>10} {'NCOA rows':>10} {'engine (s)':>12} {'us / VR row':>12} {'legacy (s)':>12} {'speedup':>9}")
+    for n_rows in args.sizes:
+        vr_df   = make_voter_roll(n_rows, "El Paso_1", rng)
+        ncoa_df = make_ncoa(vr_df, int(n_rows * args.ncoa_ratio), rng)
+
+        engine_s = time_call(match_moved_voters, ncoa_df, vr_df)
+        legacy   = ""
+        speedup  = ""
+        if n_rows <= args.legacy_max:
+            pd.testing.assert_frame_equal(legacy_match(ncoa_df, vr_df), match_moved_voters(ncoa_df, vr_df), check_dtype=False)
+            legacy_s = time_call(legacy_match, ncoa_df, vr_df, repeat=1)
+            legacy   = f"{legacy_s:.3f}"
+            speedup  = f"{legacy_s / engine_s:.0f}x"
+        print(f"{n_rows:>10} {len(ncoa_df):>10} {engine_s:>12.4f} {engine_s / n_rows * 1e6:>12.3f} {legacy:>12} {speedup:>9}")
+
+if __name__ == "__main__":
+    main()
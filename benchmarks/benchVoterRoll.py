@@ -0,0 +1,159 @@
+# Purpose: end-to-end benchmark of VoterRoll.py on a synthetic statewide tree, with per-stage timings,
+#          saved baselines and a regression threshold.
+#
+#          The tree (county directories, VR and NCOA files, voters_moved.xlsx) is generated once by
+#          benchmarks/syntheticData.py. VoterRoll.py and utilities/ are copied into it and run there, the same way
+#          the Docker image runs next to its data. Stage timings are read from the run report.
+#
+# Usage:   python benchmarks/benchVoterRoll.py [--data-dir DIR] [--counties 8] [--max-vr-rows 50000] [--repeat 3]
+#                                              [--format xlsx|csv|parquet|feather] [--save-baseline NAME] [--baseline NAME] [--threshold 0.10]
+#                                              [-- extra VoterRoll.py arguments, e.g. --workers 4]
+
+# Standard library imports
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from   typing import Any, Dict, List, Optional
+
+BENCH_DIR     = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR   = os.path.dirname(BENCH_DIR)
+BASELINES_DIR = os.path.join(BENCH_DIR, "baselines")
+sys.path.insert(0, PROJECT_DIR)
+
+from benchmarks.syntheticData import county_rank, generate_tree # noqa: E402
+
+# stages faster than this (seconds) are too noisy to flag as regressions
+MIN_STAGE_SECONDS = 0.5
+
+# copy the application code into the data directory, replacing any previous copy
+def install_app(data_dir: str) -> None:
+    shutil.copy2(os.path.join(PROJECT_DIR, "VoterRoll.py"), os.path.join(data_dir, "VoterRoll.py"))
+    shutil.rmtree(os.path.join(data_dir, "utilities"), ignore_errors=True)
+    shutil.copytree(os.path.join(PROJECT_DIR, "utilities"), os.path.join(data_dir, "utilities"), ignore=shutil.ignore_patterns("__pycache__", "._*"))
+
+# remove outputs of a previous run so every repetition does the same work
+def clean_outputs(data_dir: str, counties: List[str], keep_cache: bool) -> None:
+    shutil.rmtree(os.path.join(data_dir, "colorado_voters_moved"), ignore_errors=True)
+    if not keep_cache:
+        shutil.rmtree(os.path.join(data_dir, ".voterroll_cache"), ignore_errors=True)
+    for county in counties:
+        output = os.path.join(data_dir, county, f"{county}_voters_moved.xlsx")
+        if os.path.exists(output):
+            os.remove(output)
+
+# run VoterRoll.py once; returns total wall seconds and per-stage wall seconds from the run report
+def run_once(data_dir: str, voterroll_args: List[str]) -> Dict[str, Any]:
+    env = dict(os.environ, DOCKER_ENV="1")  # console logging only
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, "VoterRoll.py", *voterroll_args], cwd=data_dir, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    total_s = time.perf_counter() - start
+    if completed.returncode != 0:
+        raise RuntimeError(f"VoterRoll.py exited with {completed.returncode}:\n{completed.stderr[-2000:]}")
+    with open(os.path.join(data_dir, "colorado_voters_moved", "voters_moved_run_report.json"), encoding="utf-8") as f:
+        report = json.load(f)
+    return {"total_s": total_s, "stages": {name: totals["wall_s"] for name, totals in report["stage_totals"].items()}}
+
+# median of each measurement over several runs
+def summarize_runs(runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    stage_names = sorted({name for run in runs for name in run["stages"]})
+    return {
+        "total_s": round(statistics.median(run["total_s"] for run in runs), 3),
+        "stages":  {name: round(statistics.median(run["stages"].get(name, 0.0) for run in runs), 3) for name in stage_names},
+        "runs":    len(runs),
+    }
+
+# stages (and the total) that got slower than baseline by more than threshold
+def find_regressions(result: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    regressions: List[str] = []
+    pairs = [("total", result["total_s"], baseline["total_s"])]
+    pairs += [(name, result["stages"].get(name, 0.0), seconds) for name, seconds in baseline["stages"].items()]
+    for name, current, previous in pairs:
+        if previous >= MIN_STAGE_SECONDS and current > previous * (1 + threshold):
+            regressions.append(f"{name}: {previous:.3f}s -> {current:.3f}s (+{(current / previous - 1) * 100:.0f}%)")
+    return regressions
+
+def baseline_path(name: str) -> str:
+    return os.path.join(BASELINES_DIR, f"{name}.json")
+
+def print_result(result: Dict[str, Any], baseline: Optional[Dict[str, Any]]) -> None:
+    print(f"{'stage':<16} {'seconds':>10} {'baseline':>10}")
+    rows = [("total", result["total_s"], baseline["total_s"] if baseline else None)]
+    rows += [(name, seconds, baseline["stages"].get(name) if baseline else None)
+             for name, seconds in sorted(result["stages"].items(), key=lambda item: item[1], reverse=True)]
+    for name, seconds, previous in rows:
+        print(f"{name:<16} {seconds:>10.3f} {'' if previous is None else f'{previous:.3f}':>10}")
+
+def main(argv: Optional[List[str]] = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    voterroll_args: List[str] = []
+    if "--" in argv:
+        voterroll_args = argv[argv.index("--") + 1:]
+        argv           = argv[:argv.index("--")]
+
+    parser = argparse.ArgumentParser(description="End-to-end VoterRoll benchmark on synthetic data.")
+    parser.add_argument("--data-dir",      default=None,          help="synthetic tree to generate or reuse (default: a temporary directory)")
+    parser.add_argument("--counties",      type=int,   default=8, help="number of counties, largest first")
+    parser.add_argument("--max-vr-rows",   type=int,   default=50000, help="VR rows for the largest county; ~500000 is El Paso/Denver scale")
+    parser.add_argument("--ncoa-ratio",    type=float, default=0.08)
+    parser.add_argument("--seed",          type=int,   default=7)
+    parser.add_argument("--format",        choices=["csv", "feather", "parquet", "xlsx"], default="xlsx", help="synthetic input file format")
+    parser.add_argument("--repeat",        type=int,   default=3, help="runs per measurement; the median is reported")
+    parser.add_argument("--keep-cache",    action="store_true",   help="keep the input cache between runs (measures warm re-runs)")
+    parser.add_argument("--save-baseline", metavar="NAME",        help="save the result as benchmarks/baselines/NAME.json")
+    parser.add_argument("--baseline",      metavar="NAME",        help="compare against benchmarks/baselines/NAME.json")
+    parser.add_argument("--threshold",     type=float, default=0.10, help="allowed slowdown before a stage counts as a regression (default: 0.10)")
+    args = parser.parse_args(argv)
+
+    from VoterRoll import colorado_counties  # noqa: E402  only needed for the county list
+    counties = sorted(colorado_counties, key=county_rank)[:args.counties]
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="voterroll_bench_")
+    sizes    = generate_tree(data_dir, counties, args.max_vr_rows, args.ncoa_ratio, args.seed, args.format)
+    install_app(data_dir)
+
+    if args.keep_cache:  # warm the cache once, so every measured run is a re-run on unchanged inputs
+        clean_outputs(data_dir, counties, keep_cache=False)
+        run_once(data_dir, voterroll_args)
+    runs: List[Dict[str, Any]] = []
+    for _ in range(args.repeat):
+        clean_outputs(data_dir, counties, keep_cache=args.keep_cache)
+        runs.append(run_once(data_dir, voterroll_args))
+
+    result = summarize_runs(runs)
+    result["config"] = {"counties": counties, "max_vr_rows": args.max_vr_rows, "ncoa_ratio": args.ncoa_ratio, "seed": args.seed, "format": args.format,
+                        "vr_rows": sum(size["vr_rows"] for size in sizes.values()), "voterroll_args": voterroll_args,
+                        "keep_cache": args.keep_cache}
+
+    baseline = None
+    if args.baseline:
+        with open(baseline_path(args.baseline), encoding="utf-8") as f:
+            baseline = json.load(f)
+        if (baseline.get("config", {}).get("counties") != counties or baseline.get("config", {}).get("max_vr_rows") != args.max_vr_rows or
+            baseline.get("config", {}).get("format", "xlsx") != args.format):
+            print("WARNING: baseline was recorded with a different data set; comparison is not meaningful.")
+    print_result(result, baseline)
+
+    if args.save_baseline:
+        os.makedirs(BASELINES_DIR, exist_ok=True)
+        with open(baseline_path(args.save_baseline), "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"Saved baseline {baseline_path(args.save_baseline)}")
+
+    if baseline:
+        regressions = find_regressions(result, baseline, args.threshold)
+        if regressions:
+            print(f"REGRESSION (threshold {args.threshold:.0%}):")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print(f"No regressions against baseline {args.baseline} (threshold {args.threshold:.0%}).")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
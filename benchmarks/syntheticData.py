@@ -0,0 +1,206 @@
+# Purpose: generate synthetic Colorado county directories with voter roll (VR) and NCOA files for benchmarking.
+#          Files follow the naming conventions in README.md and use the real VR column set from voters_moved.xlsx.
+#
+# Usage:   python benchmarks/syntheticData.py OUT_DIR [--counties 8] [--max-vr-rows 500000] [--ncoa-ratio 0.08]
+
+# Standard library imports
+import argparse
+import os
+import re
+import shutil
+import sys
+from   typing import Dict, List, Optional
+
+# Third-party imports
+import numpy  as np
+import pandas as pd
+from   openpyxl import Workbook
+from   pandas   import DataFrame
+
+# make the project root importable when run as a script
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+VOTERS_MOVED_FILE = os.path.join(PROJECT_DIR, "voters_moved.xlsx")
+
+# NCOA columns; VoterID and NEW State are the ones VoterRoll reads
+NCOA_COLUMNS: List[str] = ["VoterID", "LAST_NAME", "FIRST_NAME", "NEW Address", "NEW City", "NEW State", "NEW Zip", "MOVE_EFFECTIVE_DATE"]
+
+# value pools
+FIRST_NAMES    = np.array(["JAMES", "MARY", "ROBERT", "PATRICIA", "JOHN", "JENNIFER", "MICHAEL", "LINDA", "DAVID", "ELIZABETH", "MARIA", "JOSE"])
+LAST_NAMES     = np.array(["SMITH", "JOHNSON", "WILLIAMS", "BROWN", "JONES", "GARCIA", "MILLER", "DAVIS", "MARTINEZ", "LOPEZ", "GONZALEZ", "WILSON"])
+STREET_NAMES   = np.array(["MAIN", "OAK", "PINE", "MAPLE", "CEDAR", "ELM", "WASHINGTON", "LAKE", "HILL", "PIKES PEAK", "COLFAX", "FEDERAL"])
+STREET_TYPES   = np.array(["ST", "AVE", "DR", "CT", "WAY", "BLVD", "LN", "RD"])
+CO_CITIES      = np.array(["DENVER", "COLORADO SPRINGS", "AURORA", "FORT COLLINS", "LAKEWOOD", "THORNTON", "PUEBLO", "GREELEY", "BOULDER"])
+OTHER_STATES   = np.array(["TX", "AZ", "CA", "FL", "WA", "OR", "NM", "UT", "WY", "NV", "NC", "GA"])
+OTHER_CITIES   = np.array(["AUSTIN", "PHOENIX", "SAN DIEGO", "TAMPA", "SEATTLE", "PORTLAND", "ALBUQUERQUE", "SALT LAKE CITY", "CHEYENNE"])
+COUNTRIES      = np.array(["CANADA", "MEXICO", "GERMANY", "UNITED KINGDOM", "JAPAN", "AUSTRALIA"])
+PARTIES        = np.array(["UAF", "DEM", "REP", "LBR", "GRN", "ACN"])
+STATUS_CODES   = np.array(["A", "I"])
+STATUS_REASONS = np.array(["", "Undeliverable Ballot", "NCOA", "Returned Mail"])
+
+# county directory name -> population rank, e.g. "El Paso_1" -> 1
+def county_rank(county: str) -> int:
+    match = re.search(r"_(\d+)$", county)
+    return int(match.group(1)) if match else 64
+
+# voter roll size for a county, scaled down from max_vr_rows by population rank
+def county_vr_rows(county: str, max_vr_rows: int, min_vr_rows: int = 500) -> int:
+    return max(min_vr_rows, int(max_vr_rows / county_rank(county) ** 0.8))
+
+# random dates between start and end
+def _random_dates(rng: np.random.Generator, n_rows: int, start: str, end: str) -> pd.DatetimeIndex:
+    start_ts = pd.Timestamp(start).value // 10 ** 9
+    end_ts   = pd.Timestamp(end).value   // 10 ** 9
+    return pd.to_datetime(rng.integers(start_ts, end_ts, size=n_rows), unit="s").normalize()
+
+# pick from values, leaving fraction_empty of the rows empty
+def _sparse_choice(rng: np.random.Generator, values: np.ndarray, n_rows: int, fraction_empty: float) -> np.ndarray:
+    picked = rng.choice(values, size=n_rows).astype(object)
+    picked[rng.random(n_rows) < fraction_empty] = None
+    return picked
+
+# VR column set, taken from the voters_moved.xlsx template
+def vr_columns() -> List[str]:
+    return list(pd.read_excel(VOTERS_MOVED_FILE, nrows=0).columns)
+
+# synthetic voter roll with the full VR column set
+# about 8% of voters have an out-of-state mailing address and 1% an out-of-country one
+def make_voter_roll(n_rows: int, county: str, rng: np.random.Generator, columns: Optional[List[str]] = None, first_voter_id: int = 100000) -> DataFrame:
+    columns     = columns or vr_columns()
+    first_names = rng.choice(FIRST_NAMES, size=n_rows)
+    last_names  = rng.choice(LAST_NAMES,  size=n_rows)
+    house_nums  = rng.integers(1, 99999, size=n_rows)
+    streets     = rng.choice(STREET_NAMES, size=n_rows)
+    street_type = rng.choice(STREET_TYPES, size=n_rows)
+    moved       = rng.random(n_rows)
+    county_name = county.rsplit("_", 1)[0].upper()
+
+    data: Dict[str, object] = {
+        "VOTER_ID":               rng.permutation(np.arange(first_voter_id, first_voter_id + n_rows)),
+        "COUNTY_CODE":            county_rank(county),
+        "COUNTY":                 county_name,
+        "LAST_NAME":              last_names,
+        "FIRST_NAME":             first_names,
+        "MIDDLE_NAME":            _sparse_choice(rng, FIRST_NAMES, n_rows, 0.4),
+        "VOTER_NAME":             np.char.add(np.char.add(first_names, " "), last_names),
+        "STATUS_CODE":            rng.choice(STATUS_CODES, size=n_rows, p=[0.85, 0.15]),
+        "PRECINCT_NAME":          rng.integers(1000000000, 9999999999, size=n_rows),
+        "ADDRESS_LIBRARY_ID":     rng.integers(1, 10 ** 7, size=n_rows),
+        "HOUSE_NUM":              house_nums,
+        "STREET_NAME":            streets,
+        "STREET_TYPE":            street_type,
+        "RESIDENTIAL_ADDRESS":    [f"{h} {s} {t}" for h, s, t in zip(house_nums, streets, street_type)],
+        "RESIDENTIAL_CITY":       rng.choice(CO_CITIES, size=n_rows),
+        "RESIDENTIAL_STATE":      "CO",
+        "RESIDENTIAL_ZIP_CODE":   rng.integers(80001, 81658, size=n_rows),
+        "EFFECTIVE_DATE":         _random_dates(rng, n_rows, "2015-01-01", "2024-06-01"),
+        "REGISTRATION_DATE":      _random_dates(rng, n_rows, "1970-01-01", "2024-06-01"),
+        "STATUS":                 rng.choice(np.array(["Active", "Inactive"]), size=n_rows, p=[0.85, 0.15]),
+        "STATUS_REASON":          rng.choice(STATUS_REASONS, size=n_rows),
+        "BIRTH_YEAR":             rng.integers(1925, 2006, size=n_rows),
+        "GENDER":                 rng.choice(np.array(["Male", "Female", "Unknown"]), size=n_rows),
+        "PRECINCT":               rng.integers(1000000000, 9999999999, size=n_rows),
+        "PARTY":                  rng.choice(PARTIES, size=n_rows),
+        "PARTY_AFFILIATION_DATE": _random_dates(rng, n_rows, "1990-01-01", "2024-06-01"),
+        "PHONE_NUM":              _sparse_choice(rng, np.array(["303-555-0100", "719-555-0100", "970-555-0100"]), n_rows, 0.7),
+        "MAILING_CITY":           np.where(moved < 0.08, rng.choice(OTHER_CITIES, size=n_rows), None),
+        "MAILING_STATE":          np.where(moved < 0.08, rng.choice(OTHER_STATES, size=n_rows), None),
+        "MAILING_COUNTRY":        np.where((moved >= 0.08) & (moved < 0.09), rng.choice(COUNTRIES, size=n_rows), None),
+        "CONGRESSIONAL":          rng.integers(1, 9, size=n_rows),
+        "STATE_SENATE":           rng.integers(1, 36, size=n_rows),
+        "STATE_HOUSE":            rng.integers(1, 66, size=n_rows),
+    }
+    return pd.DataFrame({column: data.get(column) for column in columns})
+
+# synthetic NCOA file: a sample of the voter roll plus a few unknown voter ids
+# about three quarters of the NCOA hits moved out of Colorado
+def make_ncoa(vr_df: DataFrame, n_rows: int, rng: np.random.Generator) -> DataFrame:
+    known     = rng.choice(vr_df["VOTER_ID"].to_numpy(), size=n_rows, replace=False) if n_rows <= len(vr_df) else rng.choice(vr_df["VOTER_ID"].to_numpy(), size=n_rows)
+    unknown   = rng.integers(1, 99999, size=max(1, n_rows // 50))
+    voter_ids = np.concatenate([known, unknown])
+    n_total   = len(voter_ids)
+    new_state = np.where(rng.random(n_total) < 0.25, "CO", rng.choice(OTHER_STATES, size=n_total))
+    return pd.DataFrame({
+        "VoterID":             voter_ids,
+        "LAST_NAME":           rng.choice(LAST_NAMES, size=n_total),
+        "FIRST_NAME":          rng.choice(FIRST_NAMES, size=n_total),
+        "NEW Address":         [f"{h} {s} ST" for h, s in zip(rng.integers(1, 99999, size=n_total), rng.choice(STREET_NAMES, size=n_total))],
+        "NEW City":            rng.choice(OTHER_CITIES, size=n_total),
+        "NEW State":           new_state,
+        "NEW Zip":             rng.integers(10000, 99999, size=n_total),
+        "MOVE_EFFECTIVE_DATE": _random_dates(rng, n_total, "2023-01-01", "2024-06-01"),
+    })[NCOA_COLUMNS]
+
+# write a DataFrame to .xlsx with openpyxl's write-only mode, so Denver-scale files do not need gigabytes of RAM
+def write_xlsx(df: DataFrame, file_path: str, chunk_rows: int = 10000) -> None:
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append([str(column) for column in df.columns])
+    for start in range(0, len(df), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows]
+        chunk = chunk.astype(object).where(chunk.notna(), None)
+        for row in chunk.itertuples(index=False, name=None):
+            ws.append(row)
+    wb.save(file_path)
+
+# writers per input format
+WRITERS = {
+    "xlsx":    write_xlsx,
+    "csv":     lambda df, file_path: df.to_csv(file_path, index=False),
+    "parquet": lambda df, file_path: df.to_parquet(file_path, index=False),
+    "feather": lambda df, file_path: df.to_feather(file_path),
+}
+
+# generate one county directory with a VR and an NCOA file named like the state's deliveries, in input_format
+# returns the paths written
+def write_county_dir(base_dir: str, county: str, vr_rows: int, ncoa_rows: int, rng: np.random.Generator,
+                     snapshot: str = "20240601", columns: Optional[List[str]] = None, input_format: str = "xlsx") -> Dict[str, str]:
+    county_dir = os.path.join(base_dir, county)
+    os.makedirs(county_dir, exist_ok=True)
+    vr_df   = make_voter_roll(vr_rows, county, rng, columns)
+    ncoa_df = make_ncoa(vr_df, ncoa_rows, rng)
+
+    vr_file   = os.path.join(county_dir, f"VR{snapshot[:4]}_{snapshot[4:6]}_{county}.{input_format}")
+    ncoa_file = os.path.join(county_dir, f"{snapshot}NCOA01to02_{county}.{input_format}")
+    WRITERS[input_format](vr_df,   vr_file)
+    WRITERS[input_format](ncoa_df, ncoa_file)
+    return {"vr_file": vr_file, "ncoa_file": ncoa_file}
+
+# generate a synthetic statewide tree: county directories plus a copy of voters_moved.xlsx
+# existing county files in input_format are kept, so a large tree is only generated once
+def generate_tree(base_dir: str, counties: List[str], max_vr_rows: int, ncoa_ratio: float = 0.08, seed: int = 7,
+                  input_format: str = "xlsx") -> Dict[str, Dict[str, int]]:
+    os.makedirs(base_dir, exist_ok=True)
+    shutil.copy2(VOTERS_MOVED_FILE, os.path.join(base_dir, "voters_moved.xlsx"))
+    columns = vr_columns()
+    sizes: Dict[str, Dict[str, int]] = {}
+    for county in counties:
+        rng       = np.random.default_rng([seed, county_rank(county)])  # per-county seed: same data whatever the county subset
+        vr_rows   = county_vr_rows(county, max_vr_rows)
+        ncoa_rows = max(1, int(vr_rows * ncoa_ratio))
+        sizes[county] = {"vr_rows": vr_rows, "ncoa_rows": ncoa_rows}
+        county_dir = os.path.join(base_dir, county)
+        if os.path.isdir(county_dir) and any(f.startswith("VR") and f.endswith(f".{input_format}") for f in os.listdir(county_dir)):
+            continue
+        print(f"Generating {county}: {vr_rows} VR rows, {ncoa_rows} NCOA rows")
+        write_county_dir(base_dir, county, vr_rows, ncoa_rows, rng, columns=columns, input_format=input_format)
+    return sizes
+
+def main(argv: Optional[List[str]] = None) -> None:
+    from VoterRoll import colorado_counties  # only the command line needs the county list
+
+    parser = argparse.ArgumentParser(description="Generate synthetic VoterRoll county directories.")
+    parser.add_argument("out_dir")
+    parser.add_argument("--counties",    type=int,   default=8,      help="number of counties, largest first")
+    parser.add_argument("--max-vr-rows", type=int,   default=500000, help="VR rows for the largest county (El Paso scale is ~500000)")
+    parser.add_argument("--ncoa-ratio",  type=float, default=0.08,   help="NCOA rows as a fraction of VR rows")
+    parser.add_argument("--seed",        type=int,   default=7)
+    parser.add_argument("--format",      choices=sorted(WRITERS), default="xlsx", help="input file format (parquet and feather need pyarrow)")
+    args = parser.parse_args(argv)
+
+    counties = sorted(colorado_counties, key=county_rank)[:args.counties]
+    generate_tree(args.out_dir, counties, args.max_vr_rows, args.ncoa_ratio, args.seed, args.format)
+
+if __name__ == "__main__":
+    main()
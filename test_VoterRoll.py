@@ -1,64 +1,647 @@
 # Standard library imports
+import contextlib
+import io
+import logging
 import os
+import queue
+import subprocess
+import sys
+import tempfile
+import threading
+import tracemalloc
 import unittest
 from   unittest.mock import patch
 
 # Third-party imports
+import numpy  as np
 import pandas as pd
+from   openpyxl import load_workbook
 
 # Assuming the script is named VoterRoll.py and is in the same directory as this test script
-from VoterRoll import main, BASE_DIR, VOTERS_MOVED_FILE, COLORADO_VOTERS_MOVED_DIR, colorado_counties # type: ignore
+from benchmarks.syntheticData import make_ncoa, make_voter_roll, vr_columns
+from VoterRoll import main, parse_args, finish_county, next_loaded_job, run_prefetched, CountyJob, BASE_DIR, VOTERS_MOVED_FILE, COLORADO_VOTERS_MOVED_DIR, colorado_counties # type: ignore
+from utilities.atomicFile     import atomic_path
+from utilities.excelFormatter import DARK_GREY, GAINSBORO_GREY, SILVER_GREY, STREAM_ROWS, write_formatted_workbook, write_streaming_workbook
+from utilities.fileDiscovery  import NCOA_PATTERNS, VR_PATTERNS, check_date_patterns, county_files, file_history, index_entry, latest_file, snapshot_date
+from utilities.inputCache     import InputCache
+from utilities.inputReader    import pyarrow, read_input_file
+from utilities.loggerUtilVoterRoll import log_context, logger, queueHandler, set_log_level
+from utilities.instrumentation import StageRecorder, enable_memory_tracing, instrumented, stage, summarize_stages
+from utilities.matchEngine    import VoterIdIndex, match_moved_voters
+from utilities.runState       import county_input_state, county_unchanged, load_run_state, output_fingerprints, save_run_state
+from utilities.statewideOutput import build_statewide, previous_statewide_rows, write_statewide
+from utilities.trendDiff       import delta_frame, diff_ids, load_snapshot, removed_voter_rows, save_snapshot, voter_id_array
+from utilities.voterSchema     import apply_ncoa_schema, apply_vr_schema, conform_to_template, format_output_dates, read_vr_file, whole_numbers
 
 # voter roll class
 class TestVoterRoll(unittest.TestCase):
 
+    @patch('VoterRoll.write_run_report')
+    @patch('VoterRoll.write_manifest')
+    @patch('VoterRoll.write_county_workbook')
     @patch('VoterRoll.pd.read_excel')
     @patch('VoterRoll.pd.DataFrame.to_excel')
     @patch('VoterRoll.os.path.exists')
     @patch('VoterRoll.os.makedirs')
     @patch('VoterRoll.os.path.isdir')
-    @patch('VoterRoll.os.listdir')
+    @patch('VoterRoll.save_file_index')
+    @patch('VoterRoll.load_file_index', return_value={})
+    @patch('VoterRoll.county_files')
     @patch('VoterRoll.shutil.copy2')
-    @patch('VoterRoll.os.remove')
+    @patch('VoterRoll.os.replace')
     @patch('VoterRoll.os.rename')
-    def test_main(self, mock_rename, mock_remove, mock_copy2, mock_listdir, mock_isdir, mock_makedirs, mock_exists, mock_to_excel, mock_read_excel):
+    def test_main(self, mock_rename, mock_replace, mock_copy2, mock_county_files, mock_load_file_index, mock_save_file_index, mock_isdir, mock_makedirs, mock_exists, mock_to_excel, mock_read_excel, mock_write_county_workbook, mock_write_manifest, mock_write_run_report):
         # Setup mock behaviors
-        mock_exists.side_effect  = lambda path: True if path == VOTERS_MOVED_FILE else False
+        mock_exists.side_effect  = lambda path: path == VOTERS_MOVED_FILE
         mock_isdir.side_effect   = lambda path: path.startswith(BASE_DIR)
-        mock_listdir.side_effect = lambda path: ['NCOA_20240101.xlsx', 'VR_20240101.xlsx'] if path.startswith(BASE_DIR) else []
+        mock_county_files.side_effect = lambda path, *args: index_entry(['NCOA_20240101.xlsx', 'VR_20240101.xlsx', 'VR_20230101.xlsx'])
 
         # Mock DataFrames for read_excel
         voters_moved_df = pd.DataFrame({'VoterID': [1],  'NEW State': ['TX']})
         ncoa_df         = pd.DataFrame({'VoterID': [1],  'NEW State': ['TX']})
         vr_df           = pd.DataFrame({'VOTER_ID': [1], 'EFFECTIVE_DATE': ['2024-01-01'], 'REGISTRATION_DATE': ['2024-01-01'], 'PARTY_AFFILIATION_DATE': ['2024-01-01'], 'MAILING_STATE': ['TX'], 'MAILING_COUNTRY': ['USA']})
 
-        # Mock read_excel to return different DataFrames for each call
-        mock_read_excel.side_effect = [voters_moved_df] + [ncoa_df, vr_df] * len(colorado_counties)
+        # Mock read_excel to return the DataFrame that matches each file
+        mock_read_excel.side_effect = lambda path, **kwargs: ncoa_df if 'NCOA' in path else vr_df if 'VR_' in path else voters_moved_df
 
         # Run the main function
         main()
 
-        # Check if files are copied and renamed
+        # the template is parsed once and never copied or renamed into county directories
+        self.assertEqual([c for c in mock_read_excel.call_args_list if c.args[0] == VOTERS_MOVED_FILE], [unittest.mock.call(VOTERS_MOVED_FILE)])
+        mock_to_excel.assert_not_called()
+        mock_rename.assert_not_called()
+
+        # Check that each county file is written directly to its final path and copied atomically
         for county in colorado_counties:
             sub_dir_path      = os.path.join(BASE_DIR, county)
-            old_path          = os.path.join(sub_dir_path, "voters_moved.xlsx")
             new_path          = os.path.join(sub_dir_path, f"{county}_voters_moved.xlsx")
             moved_county_file = os.path.join(COLORADO_VOTERS_MOVED_DIR, f"{county}_voters_moved.xlsx")
 
-            mock_read_excel.assert_any_call(VOTERS_MOVED_FILE)
-            mock_to_excel.assert_any_call(old_path, index=False)
+            mock_write_county_workbook.assert_any_call(unittest.mock.ANY, new_path, stream_rows=STREAM_ROWS)
+            mock_copy2.assert_any_call(new_path, unittest.mock.ANY)
+            mock_replace.assert_any_call(unittest.mock.ANY, moved_county_file)
 
-            try:
-                mock_rename.assert_any_call(old_path, new_path)
-            except AssertionError:
-                print(f"Expected rename call not found: rename({old_path}, {new_path})")
-                print(f"Actual rename calls: {mock_rename.call_args_list}")
-                raise
+        # Check if directories are created
+        mock_makedirs.assert_called_with(COLORADO_VOTERS_MOVED_DIR, exist_ok=True)
 
-            mock_copy2.assert_any_call(new_path, moved_county_file)
+        # Check that one result per county was written to the run manifest
+        results = mock_write_manifest.call_args[0][0]
+        self.assertEqual([r['county'] for r in results], colorado_counties)
+        self.assertTrue(all(r['rows_matched'] == 1 for r in results))
 
-        # Check if directories are created
-        mock_makedirs.assert_called_with(COLORADO_VOTERS_MOVED_DIR)
+        # Check that the run report has the template load and each county's read, match and write stages
+        stages = mock_write_run_report.call_args[0][2]
+        self.assertEqual(stages[0]['stage'], 'load_template')
+        adams  = {m['stage']: m for m in stages if m['county'] == 'Adams_5'}
+        self.assertTrue({'read_ncoa', 'read_vr', 'match', 'sort_dates', 'write', 'copy_output'} <= set(adams))
+        self.assertEqual(adams['match']['rows'], 1)
+
+        # the newest VR snapshot is used and every county's file index entry is saved
+        self.assertEqual(results[0]['vr_file'], 'VR_20240101.xlsx')
+        self.assertEqual(sorted(mock_save_file_index.call_args[0][0]), sorted(colorado_counties))
+        self.assertNotIn('file_index', results[0])
+
+    @patch('VoterRoll.save_file_index')
+    @patch('VoterRoll.load_file_index', return_value={})
+    @patch('VoterRoll.write_run_report')
+    @patch('VoterRoll.write_manifest')
+    @patch('VoterRoll.pd.read_excel')
+    @patch('VoterRoll.os.makedirs')
+    @patch('VoterRoll.os.path.isdir')
+    def test_bad_county_does_not_stop_run(self, mock_isdir, mock_makedirs, mock_read_excel, mock_write_manifest, mock_write_run_report, mock_load_file_index, mock_save_file_index):
+        def isdir(path):
+            if path.endswith('Adams_5'):
+                raise RuntimeError('disk error')
+            return False
+        mock_isdir.side_effect = isdir
+
+        results = main()
+
+        self.assertEqual(len(results), len(colorado_counties))
+        self.assertEqual(results[0]['status'], 'error')
+        self.assertIn('disk error', results[0]['errors'][0])
+        self.assertTrue(all(r['status'] == 'skipped' for r in results[1:]))
+
+    @patch('VoterRoll.write_run_report')
+    @patch('VoterRoll.write_manifest')
+    @patch('VoterRoll.write_county_workbook')
+    @patch('VoterRoll.pd.read_excel')
+    @patch('VoterRoll.os.path.exists')
+    @patch('VoterRoll.os.makedirs')
+    @patch('VoterRoll.os.path.isdir')
+    @patch('VoterRoll.save_file_index')
+    @patch('VoterRoll.load_file_index', return_value={})
+    @patch('VoterRoll.county_files')
+    @patch('VoterRoll.shutil.copy2')
+    @patch('VoterRoll.os.replace')
+    def test_prefetch(self, mock_replace, mock_copy2, mock_county_files, mock_load_file_index, mock_save_file_index, mock_isdir, mock_makedirs, mock_exists, mock_read_excel, mock_write_county_workbook, mock_write_manifest, mock_write_run_report):
+        mock_exists.side_effect  = lambda path: path == VOTERS_MOVED_FILE
+        mock_isdir.side_effect   = lambda path: path.startswith(BASE_DIR) and 'Baca_56' not in path
+        mock_county_files.side_effect = lambda path, *args: index_entry(['NCOA_20240101.xlsx', 'VR_20240101.xlsx'])
+
+        ncoa_df = pd.DataFrame({'VoterID': [1],  'NEW State': ['TX']})
+        vr_df   = pd.DataFrame({'VOTER_ID': [1], 'EFFECTIVE_DATE': ['2024-01-01'], 'REGISTRATION_DATE': ['2024-01-01'], 'PARTY_AFFILIATION_DATE': ['2024-01-01'], 'MAILING_STATE': ['TX'], 'MAILING_COUNTRY': ['USA']})
+        input_threads = set()
+        def read_excel(path, **kwargs):
+            if path == VOTERS_MOVED_FILE:
+                return pd.DataFrame()
+            input_threads.add(threading.current_thread().name)
+            return ncoa_df if 'NCOA' in path else vr_df
+        mock_read_excel.side_effect = read_excel
+
+        results = main(prefetch=2)
+
+        # inputs are parsed on the prefetch thread; results keep county order
+        self.assertEqual(input_threads, {'county-prefetch'})
+        self.assertEqual([r['county'] for r in results], colorado_counties)
+        self.assertEqual({r['county']: r['status'] for r in results if r['status'] != 'ok'}, {'Baca_56': 'skipped'})
+        self.assertTrue(all(r['rows_matched'] == 1 for r in results if r['status'] == 'ok'))
+
+        # each county's stages are recorded across both threads, and the wait for inputs is reported
+        stages = mock_write_run_report.call_args[0][2]
+        adams  = {m['stage'] for m in stages if m['county'] == 'Adams_5'}
+        self.assertTrue({'read_ncoa', 'read_vr', 'match', 'write', 'copy_output'} <= adams)
+        self.assertIn('prefetch_wait', {m['stage'] for m in stages if m['county'] == 'statewide'})
+        self.assertEqual(mock_write_run_report.call_args[0][1]['prefetch'], 2)
+
+    # a county that raises outside its load phase is reported as an error, and the run goes on instead of hanging
+    @patch('VoterRoll.finish_county', side_effect=lambda job, *args, **kwargs: job.finish())
+    @patch('VoterRoll.load_county')
+    def test_prefetch_loader_failure(self, mock_load_county, mock_finish_county):
+        def load_county(sub_dir, **kwargs):
+            if sub_dir == 'Weld_8':
+                raise OSError('disk gone')
+            return CountyJob(sub_dir)
+        mock_load_county.side_effect = load_county
+        results = run_prefetched(['Adams_5', 'Weld_8', 'Yuma_38'], 1, pd.DataFrame(), StageRecorder('statewide'))
+        self.assertEqual([(r['county'], r['status']) for r in results], [('Adams_5', 'ok'), ('Weld_8', 'error'), ('Yuma_38', 'ok')])
+        self.assertEqual(results[1]['errors'], ['disk gone'])
+
+        # a loader thread that stopped without queueing the county
+        stopped = threading.Thread(target=lambda: None)
+        stopped.start()
+        stopped.join()
+        self.assertEqual(next_loaded_job(queue.Queue(), stopped, 'Yuma_38').finish()['status'], 'error')
+
+# match engine class
+class TestMatchEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.vr_df   = pd.DataFrame({'VOTER_ID': [10, 11, 12, 13, 11], 'MAILING_STATE': ['TX', 'AZ', None, 'NM', 'WY']})
+        self.ncoa_df = pd.DataFrame({'VoterID': [13, 11, 12, 99, 13], 'NEW State': ['TX', 'FL', 'CO', 'AZ', 'TX']})
+
+    # same rows, in the same order, as the original iterrows/concat loop
+    def test_matches_legacy_loop(self):
+        expected = pd.DataFrame(columns=self.vr_df.columns)
+        for _, row in self.ncoa_df.iterrows():
+            if row['NEW State'] != 'CO':
+                expected = pd.concat([expected, self.vr_df[self.vr_df['VOTER_ID'] == row['VoterID']]], ignore_index=True)
+
+        result = match_moved_voters(self.ncoa_df, self.vr_df)
+        pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+        self.assertEqual(result['VOTER_ID'].tolist(), [13, 11, 11, 13])
+
+    # synthetic benchmark data has the real VR column set and produces out-of-state matches
+    def test_synthetic_data(self):
+        rng     = np.random.default_rng(1)
+        vr_df   = make_voter_roll(500, 'Weld_8', rng)
+        ncoa_df = make_ncoa(vr_df, 50, rng)
+        self.assertEqual(list(vr_df.columns), vr_columns())
+        self.assertTrue(vr_df['VOTER_ID'].is_unique)
+        matches = match_moved_voters(ncoa_df, vr_df)
+        self.assertEqual(len(matches), (ncoa_df['VoterID'].isin(vr_df['VOTER_ID']) & (ncoa_df['NEW State'] != 'CO')).sum())
+
+    # index is built once and reused across lookups; text voter ids still match numeric ones
+    def test_index_reuse_and_text_ids(self):
+        index = VoterIdIndex(self.vr_df)
+        self.assertEqual(match_moved_voters(self.ncoa_df, self.vr_df, index)['VOTER_ID'].tolist(), [13, 11, 11, 13])
+        self.assertEqual(index.lookup(['12', '10'])['VOTER_ID'].tolist(), [12, 10])
+        self.assertTrue(index.lookup([]).empty)
+
+# voter schema class
+class TestVoterSchema(unittest.TestCase):
+
+    def setUp(self):
+        self.vr_df = pd.DataFrame({'VOTER_ID': ['10', '11', '12'], 'MAILING_STATE': ['TX', None, 'TX'], 'EFFECTIVE_DATE': ['2024-01-31', '2023-12-01', None]})
+
+    def test_vr_schema(self):
+        typed = apply_vr_schema(self.vr_df)
+        self.assertEqual(str(typed['VOTER_ID'].dtype), 'Int64')
+        self.assertIsInstance(typed['MAILING_STATE'].dtype, pd.CategoricalDtype)
+        self.assertTrue(pd.api.types.is_datetime64_any_dtype(typed['EFFECTIVE_DATE'].dtype))
+        self.assertEqual(whole_numbers(pd.Series(['10', 'A11'], name='VOTER_ID')).tolist(), [10, 'A11'])  # typed per value, like Excel cells
+
+    # a malformed date or a second date layout in the voter roll does not fail the county; unreadable values are left empty with a warning
+    def test_mixed_and_bad_dates(self):
+        vr_df = pd.DataFrame({'VOTER_ID': ['10', '11', '12'], 'EFFECTIVE_DATE': ['2024-01-01', '01/05/2023', 'not a date']})
+        with self.assertLogs(logger, level='WARNING') as logs:
+            typed = apply_vr_schema(vr_df)
+        self.assertIn('1 EFFECTIVE_DATE value(s) could not be read as dates', logs.output[0])
+        self.assertEqual(format_output_dates(typed)['EFFECTIVE_DATE'].fillna('').tolist(), ['01/01/2024', '01/05/2023', ''])
+
+    # typed NCOA and VR frames match as before; the county frame keeps its dtypes until dates are formatted for output
+    def test_typed_match_and_output_dates(self):
+        ncoa_df  = apply_ncoa_schema(pd.DataFrame({'VoterID': [12, 11, 10], 'NEW State': ['AZ', 'CO', 'NM']}))
+        template = pd.DataFrame(columns=['VOTER_ID', 'EFFECTIVE_DATE', 'MAILING_STATE', 'MAILING_COUNTRY'])
+        county_df = conform_to_template(template, match_moved_voters(ncoa_df, apply_vr_schema(self.vr_df)))
+        self.assertEqual(list(county_df.columns), ['VOTER_ID', 'EFFECTIVE_DATE', 'MAILING_STATE', 'MAILING_COUNTRY'])
+        self.assertEqual(str(county_df['VOTER_ID'].dtype), 'Int64')
+        self.assertEqual(county_df['VOTER_ID'].tolist(), [12, 10])
+        self.assertEqual(format_output_dates(county_df)['EFFECTIVE_DATE'].fillna('').tolist(), ['', '01/31/2024'])
+
+# Excel formatter class
+class TestExcelFormatter(unittest.TestCase):
+
+    # frozen header, autofit widths and row fills are all in the single saved workbook
+    def test_write_formatted_workbook(self):
+        self.check_formatted_workbook(write_formatted_workbook)
+
+    # the streaming writer produces the same formatting as the in-memory writer
+    def test_write_streaming_workbook(self):
+        self.check_formatted_workbook(write_streaming_workbook)
+
+    def check_formatted_workbook(self, writer):
+        df = pd.DataFrame({'VOTER_ID': [1, 2, 3], 'MAILING_STATE': ['TX', None, ''], 'MAILING_COUNTRY': [None, 'CANADA', None]})
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_path = os.path.join(tmp_dir, 'county_voters_moved.xlsx')
+            writer(df, file_path)
+            ws = load_workbook(file_path).active
+
+            self.assertEqual(ws.freeze_panes, 'A2')
+            self.assertEqual([cell.value for cell in ws[1]], ['VOTER_ID', 'MAILING_STATE', 'MAILING_COUNTRY'])
+            self.assertEqual([ws.cell(row=r, column=3).fill.start_color.rgb[-6:] for r in (2, 3, 4)], [GAINSBORO_GREY, SILVER_GREY, DARK_GREY])
+            self.assertEqual(ws.column_dimensions['B'].width, len('MAILING_STATE') + 5)
+            self.assertIsNone(ws.cell(row=3, column=2).value)
+
+# atomic file class
+class TestAtomicPath(unittest.TestCase):
+
+    # a failed write leaves the previous file untouched and no temporary file behind
+    def test_failed_write_keeps_previous_file(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_path = os.path.join(tmp_dir, 'Adams_5_voters_moved.xlsx')
+            with atomic_path(file_path) as tmp_path:
+                with open(tmp_path, 'w') as f:
+                    f.write('first run')
+            with self.assertRaises(RuntimeError):
+                with atomic_path(file_path) as tmp_path:
+                    with open(tmp_path, 'w') as f:
+                        f.write('half written')
+                    raise RuntimeError('disk full')
+            with open(file_path) as f:
+                self.assertEqual(f.read(), 'first run')
+            self.assertEqual(os.listdir(tmp_dir), ['Adams_5_voters_moved.xlsx'])
+
+# instrumentation class
+class TestInstrumentation(unittest.TestCase):
+
+    # stages record wall/CPU time and rows; nested stage peaks roll up into the parent
+    def test_stage_recorder(self):
+        @instrumented('build')
+        def build():
+            return [0] * 200000
+
+        enable_memory_tracing()
+        self.addCleanup(tracemalloc.stop)
+        with StageRecorder('Adams_5') as recorder:
+            with stage('write', rows=3) as metrics:
+                build()
+            with stage('match') as metrics:
+                metrics['rows'] = 7
+        with stage('outside'):  # no current recorder: nothing is recorded
+            pass
+
+        self.assertEqual([m['stage'] for m in recorder.stages], ['build', 'write', 'match'])
+        by_stage = {m['stage']: m for m in recorder.stages}
+        self.assertEqual((by_stage['write']['rows'], by_stage['match']['rows']), (3, 7))
+        self.assertGreaterEqual(by_stage['write']['peak_mb'], by_stage['build']['peak_mb'])
+        self.assertGreater(by_stage['build']['peak_mb'], 1)
+        self.assertEqual(summarize_stages(recorder.stages)['match']['rows'], 7)
+
+# input cache class
+class TestInputCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir    = tempfile.TemporaryDirectory()
+        self.input_file = os.path.join(self.tmp_dir.name, 'VR2024_05_Adams_5.csv')
+        self.cache_dir  = os.path.join(self.tmp_dir.name, 'cache')
+        pd.DataFrame({'VOTER_ID': [1, 2, 3]}).to_csv(self.input_file, index=False)
+        self.reads = 0
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def reader(self, path):
+        self.reads += 1
+        return pd.read_csv(path)
+
+    # an unchanged input is parsed once; a changed input is parsed again
+    def test_hits_and_misses(self):
+        cache = InputCache(self.cache_dir)
+        first  = cache.read(self.input_file, reader=self.reader)
+        second = cache.read(self.input_file, reader=self.reader)
+        pd.testing.assert_frame_equal(first, second)
+        self.assertEqual(self.reads, 1)
+        self.assertEqual((cache.stats['hits'], cache.stats['misses']), (1, 1))
+        self.assertEqual(cache.stats['bytes_saved'], os.path.getsize(self.input_file))
+
+        pd.DataFrame({'VOTER_ID': [4]}).to_csv(self.input_file, index=False)
+        self.assertEqual(cache.read(self.input_file, reader=self.reader)['VOTER_ID'].tolist(), [4])
+        self.assertEqual(self.reads, 2)
+
+    # entries beyond max_bytes are evicted
+    def test_eviction(self):
+        cache = InputCache(self.cache_dir, max_bytes=0)
+        cache.read(self.input_file, reader=self.reader)
+        self.assertEqual(cache.stats['evictions'], 1)
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
+# run state class
+class TestRunState(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root    = self.tmp_dir.name
+        for name in ('20240501NCOA01to02_Adams_5.xlsx', 'VR2024_05_Adams_5.xlsx', 'voters_moved.xlsx', 'Adams_5_voters_moved.xlsx'):
+            with open(os.path.join(self.root, name), 'w') as f:
+                f.write(name)
+        self.template = output_fingerprints(os.path.join(self.root, 'voters_moved.xlsx')).popitem()[1]
+        self.output   = os.path.join(self.root, 'Adams_5_voters_moved.xlsx')
+        state         = county_input_state(self.root, '20240501NCOA01to02_Adams_5.xlsx', 'VR2024_05_Adams_5.xlsx', self.template)
+        self.previous = {**state, 'rows_matched': 3, 'output_fingerprints': output_fingerprints(self.output)}
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def current(self):
+        return county_input_state(self.root, '20240501NCOA01to02_Adams_5.xlsx', 'VR2024_05_Adams_5.xlsx', self.template, self.previous)
+
+    def test_unchanged(self):
+        self.assertTrue(county_unchanged(self.previous, self.current()))
+        self.assertFalse(county_unchanged(None, self.current()))
+
+    # new VR content forces the county to be reprocessed
+    def test_changed_input(self):
+        with open(os.path.join(self.root, 'VR2024_05_Adams_5.xlsx'), 'w') as f:
+            f.write('a newer voter roll')
+        self.assertFalse(county_unchanged(self.previous, self.current()))
+
+    # so does a deleted output
+    def test_missing_output(self):
+        os.remove(self.output)
+        self.assertFalse(county_unchanged(self.previous, self.current()))
+
+    def test_save_and_load(self):
+        state_file = os.path.join(self.root, 'state.json')
+        save_run_state({'Adams_5': self.previous}, state_file)
+        self.assertEqual(load_run_state(state_file), {'Adams_5': self.previous})
+        self.assertEqual(load_run_state(os.path.join(self.root, 'missing.json')), {})
+
+# statewide output class
+class TestStatewideOutput(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.frames  = {
+            'Adams_5': pd.DataFrame({'VOTER_ID': [1, 2],     'COUNTY': ['ADAMS', 'ADAMS'], 'MAILING_STATE': ['TX', 'AZ'], 'MAILING_COUNTRY': [None, None]}),
+            'Weld_8':  pd.DataFrame({'VOTER_ID': ['2', '3'], 'COUNTY': ['WELD', 'WELD'],   'MAILING_STATE': ['AZ', None], 'MAILING_COUNTRY': [None, 'CANADA']}),
+            'Yuma_38': pd.DataFrame({'VOTER_ID': [2.0],      'COUNTY': ['YUMA'],           'MAILING_STATE': ['AZ'],       'MAILING_COUNTRY': [None]}),
+        }
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    # VOTER_ID 2 is matched in three counties, whatever its dtype in each county file; the VR COUNTY column is kept
+    def test_duplicates_flagged(self):
+        statewide_df = build_statewide(self.frames)
+        self.assertEqual(list(statewide_df.columns), ['SOURCE_COUNTY_DIR', 'VOTER_ID', 'COUNTY', 'MAILING_STATE', 'MAILING_COUNTRY', 'COUNTY_COUNT', 'DUPLICATE_COUNTIES'])
+        self.assertEqual(statewide_df['SOURCE_COUNTY_DIR'].tolist(), ['Adams_5', 'Adams_5', 'Weld_8', 'Weld_8', 'Yuma_38'])
+        self.assertEqual(statewide_df['COUNTY'].tolist(), ['ADAMS', 'ADAMS', 'WELD', 'WELD', 'YUMA'])
+        self.assertEqual(statewide_df['COUNTY_COUNT'].tolist(), [1, 3, 3, 1, 3])
+        self.assertEqual(statewide_df['DUPLICATE_COUNTIES'].tolist(), ['', 'Adams_5, Weld_8, Yuma_38', 'Adams_5, Weld_8, Yuma_38', '', 'Adams_5, Weld_8, Yuma_38'])
+
+    def test_write_and_carry_over(self):
+        files = write_statewide(build_statewide(self.frames), self.tmp_dir.name, xlsx=True)
+        self.assertTrue(all(os.path.exists(f) for f in files))
+        self.assertEqual(load_workbook(files[-1]).sheetnames, ['Adams_5', 'Weld_8', 'Yuma_38'])
+        ws = load_workbook(files[-1])['Weld_8']
+        self.assertEqual([cell.value for cell in ws[1]][:2], ['VOTER_ID', 'COUNTY'])
+        self.assertEqual(ws['B2'].value, 'WELD')
+
+        previous = previous_statewide_rows(self.tmp_dir.name, ['Weld_8'])
+        self.assertEqual(list(previous), ['Weld_8'])
+        self.assertEqual(previous['Weld_8']['VOTER_ID'].tolist(), ['2', '3'])
+        self.assertEqual(previous['Weld_8']['COUNTY'].tolist(), ['WELD', 'WELD'])
+
+    # a run without --statewide-xlsx removes the workbook an earlier run wrote
+    def test_stale_files_removed(self):
+        xlsx_file = write_statewide(build_statewide(self.frames), self.tmp_dir.name, xlsx=True)[-1]
+        files = write_statewide(build_statewide(self.frames), self.tmp_dir.name)
+        self.assertFalse(os.path.exists(xlsx_file))
+        self.assertEqual(sorted(files), sorted(os.path.join(self.tmp_dir.name, f) for f in os.listdir(self.tmp_dir.name)))
+
+# input reader class
+class TestInputReader(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root    = self.tmp_dir.name
+        self.df      = pd.DataFrame({'VoterID': [1, 2], 'NEW State': ['TX', 'CO'], 'NEW ZIP': ['02134', '80202']})
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    # CSV columns are read as text, so ZIP codes keep their leading zeros
+    def test_csv(self):
+        csv_file = os.path.join(self.root, '20240601NCOA01to02_Adams_5.csv')
+        self.df.to_csv(csv_file, index=False)
+        df = read_input_file(csv_file)
+        self.assertEqual(df['NEW ZIP'].tolist(), ['02134', '80202'])
+        self.assertEqual(list(read_input_file(csv_file, columns=['VoterID', 'NEW State']).columns), ['VoterID', 'NEW State'])
+
+    def test_xlsx_columns(self):
+        xlsx_file = os.path.join(self.root, '20240601NCOA01to02_Adams_5.xlsx')
+        self.df.to_excel(xlsx_file, index=False)
+        self.assertEqual(read_input_file(xlsx_file, columns=['VoterID', 'NEW State']).to_dict('list'), {'VoterID': [1, 2], 'NEW State': ['TX', 'CO']})
+
+    @unittest.skipIf(pyarrow is None, 'pyarrow is not installed')
+    def test_parquet_and_feather(self):
+        for extension, write in (('.parquet', self.df.to_parquet), ('.feather', self.df.to_feather)):
+            file_path = os.path.join(self.root, 'VR2024_05_Adams_5' + extension)
+            write(file_path)
+            self.assertEqual(read_input_file(file_path, columns=['VoterID']).to_dict('list'), {'VoterID': [1, 2]})
+
+    # the same voter roll read from CSV and from Excel gives the same typed columns; integers are typed chunk by chunk
+    def test_csv_matches_xlsx(self):
+        vr_df = pd.DataFrame({'VOTER_ID': [10, 11, 12, 13], 'HOUSE_NUM': [101, 22, 3, 4], 'BIRTH_YEAR': [1950, 1980, 2001, 1977], 'MAILING_ZIP_CODE': ['02134', None, 'K1A 0B1', None]})
+        self.assert_csv_matches_xlsx(vr_df)
+        self.assertEqual(str(self.from_csv['HOUSE_NUM'].dtype), 'Int64')
+        self.assertEqual(self.from_csv['MAILING_ZIP_CODE'].tolist()[0], '02134')
+
+    # a value that is not a whole number is kept as read, value by value like Excel cells, wherever the chunk boundaries fall;
+    # the second chunk holds both '44' and '3A', and the warning is logged once for the column
+    def test_csv_mixed_chunk_matches_xlsx(self):
+        vr_df = pd.DataFrame({'VOTER_ID': [10, 11, 12, 13], 'HOUSE_NUM': [101, 22, 44, '3A']})
+        with self.assertLogs(logger, level='WARNING') as logs:
+            self.assert_csv_matches_xlsx(vr_df)
+        self.assertEqual(self.from_csv['HOUSE_NUM'].tolist(), [101, 22, 44, '3A'])
+        self.assertEqual(sum('HOUSE_NUM' in line for line in logs.output), 2)  # once for the CSV, once for the xlsx
+
+    def assert_csv_matches_xlsx(self, vr_df):
+        vr_df.to_csv(os.path.join(self.root, 'VR2024_05_Adams_5.csv'), index=False)
+        vr_df.to_excel(os.path.join(self.root, 'VR2024_05_Adams_5.xlsx'), index=False)
+        with patch('utilities.inputReader.CSV_CHUNK_ROWS', 2):
+            self.from_csv = read_vr_file(os.path.join(self.root, 'VR2024_05_Adams_5.csv'))
+        from_xlsx = read_vr_file(os.path.join(self.root, 'VR2024_05_Adams_5.xlsx'))
+        pd.testing.assert_frame_equal(self.from_csv, from_xlsx)
+
+    # a snapshot delivered as both xlsx and csv is read from the csv
+    def test_fastest_format_selected(self):
+        names = ['VR2024_05_Adams_5.xlsx', 'VR2024_05_Adams_5.csv', 'VR2023_12_Adams_5.xlsx', 'VR2024_05_Adams_5.txt']
+        entry = index_entry(names)
+        self.assertEqual(latest_file(entry, 'vr'), 'VR2024_05_Adams_5.csv')
+        self.assertEqual([s['file'] for s in file_history(entry, 'vr')], ['VR2023_12_Adams_5.xlsx', 'VR2024_05_Adams_5.csv'])
+        with self.assertRaises(ValueError):
+            read_input_file(os.path.join(self.root, 'VR2024_05_Adams_5.txt'))
+
+# file discovery class
+class TestFileDiscovery(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root    = self.tmp_dir.name
+        for name in ['20240101NCOA01to02_Adams_5.xlsx', '20240601NCOA01to02_Adams_5.xlsx', 'VR2023_12_Adams_5.xlsx', 'VR2024_05_Adams_5.xlsx',
+                     'Adams_5_voters_moved.xlsx', '~$VR2024_05_Adams_5.xlsx']:
+            open(os.path.join(self.root, name), 'w').close()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_snapshot_dates(self):
+        self.assertEqual(snapshot_date('20240601NCOA01to02_Adams_5.xlsx', NCOA_PATTERNS), '2024-06-01')
+        self.assertEqual(snapshot_date('NCOA_20240101.xlsx', NCOA_PATTERNS), '2024-01-01')
+        self.assertEqual(snapshot_date('VR2024_05_Adams_5.xlsx', VR_PATTERNS), '2024-05-01')
+        self.assertEqual(snapshot_date('VR_20240115.xlsx', VR_PATTERNS), '2024-01-15')
+        self.assertIsNone(snapshot_date('VR_latest.xlsx', VR_PATTERNS))
+
+    # user date patterns must compile and have year and month groups; --vr-pattern/--ncoa-pattern stop at argument parsing
+    def test_bad_patterns(self):
+        check_date_patterns(NCOA_PATTERNS + VR_PATTERNS)
+        with self.assertRaisesRegex(ValueError, 'month'):
+            check_date_patterns([r'^VR(?P<year>\d{4})'])
+        with self.assertRaisesRegex(ValueError, 'invalid'):
+            check_date_patterns([r'^VR(?P<year'])
+        with contextlib.redirect_stderr(io.StringIO()), self.assertRaises(SystemExit):
+            parse_args(['--vr-pattern', r'^VR(?P<year>\d{4})'])
+        with self.assertRaises(ValueError):
+            main(vr_patterns=[r'^VR_(?P<day>\d{2})'])
+
+    # snapshots are ordered by the dates in their names; outputs and Excel lock files are ignored
+    def test_latest_and_history(self):
+        entry = county_files(self.root)
+        self.assertEqual(latest_file(entry, 'ncoa'), '20240601NCOA01to02_Adams_5.xlsx')
+        self.assertEqual(latest_file(entry, 'vr'), 'VR2024_05_Adams_5.xlsx')
+        self.assertEqual([s['date'] for s in file_history(entry, 'vr')], ['2023-12-01', '2024-05-01'])
+        self.assertIsNone(latest_file(index_entry([]), 'ncoa'))
+
+    # the previous entry is reused until the directory changes
+    def test_index_reuse(self):
+        entry = county_files(self.root)
+        with patch('utilities.fileDiscovery.os.scandir') as mock_scandir:
+            self.assertIs(county_files(self.root, entry), entry)
+            mock_scandir.assert_not_called()
+        open(os.path.join(self.root, 'VR2024_06_Adams_5.xlsx'), 'w').close()
+        os.utime(self.root, ns=(entry['dir_mtime_ns'] + 10 ** 9, entry['dir_mtime_ns'] + 10 ** 9))
+        self.assertEqual(latest_file(county_files(self.root, entry), 'vr'), 'VR2024_06_Adams_5.xlsx')
+
+# trend diff class
+class TestTrendDiff(unittest.TestCase):
+
+    def test_diff_ids(self):
+        previous = voter_id_array(pd.Series([3, 1, 2, 2]))
+        self.assertEqual(previous.tolist(), [1, 2, 3])
+        added, removed = diff_ids(previous, voter_id_array(pd.Series([2, 3, 4], dtype='Int64')))
+        self.assertEqual((added.tolist(), removed.tolist()), ([4], [1]))
+        added, removed = diff_ids(previous, voter_id_array(pd.Series(['2', '3', 'A4'])))  # ids switched to text
+        self.assertEqual((added.tolist(), removed.tolist()), (['A4'], ['1']))
+
+    def test_snapshot_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            snapshot_file = os.path.join(tmp_dir, 'trend', 'Adams_5_voter_ids.npz')
+            self.assertIsNone(load_snapshot(snapshot_file))
+            save_snapshot(snapshot_file, np.array([1, 2, 3]), '20240601NCOA01to02_Adams_5.xlsx')
+            voter_ids, ncoa_file = load_snapshot(snapshot_file)
+            self.assertEqual((voter_ids.tolist(), ncoa_file), ([1, 2, 3], '20240601NCOA01to02_Adams_5.xlsx'))
+            self.assertEqual(os.listdir(os.path.dirname(snapshot_file)), ['Adams_5_voter_ids.npz'])
+
+    # added voters come from the county output; removed voters from the current VR, or by id alone when they left the VR
+    def test_delta_frame(self):
+        vr_df     = apply_vr_schema(pd.DataFrame({'VOTER_ID': ['10', '11', '12'], 'MAILING_STATE': ['TX', 'AZ', None], 'EFFECTIVE_DATE': ['2024-01-31', None, None]}))
+        county_df = format_output_dates(vr_df[vr_df['VOTER_ID'] == 12])
+        removed_rows = removed_voter_rows(VoterIdIndex(vr_df), np.array([10, 13]))
+        delta_df  = delta_frame(county_df, np.array([12]), removed_rows)
+        self.assertEqual(list(delta_df.columns), ['CHANGE', 'VOTER_ID', 'MAILING_STATE', 'EFFECTIVE_DATE'])
+        self.assertEqual(delta_df['CHANGE'].tolist(), ['added', 'removed', 'removed'])
+        self.assertEqual(delta_df['VOTER_ID'].tolist(), [12, 10, 13])
+        self.assertEqual(delta_df['EFFECTIVE_DATE'].fillna('').tolist(), ['', '01/31/2024', ''])
+
+    # an unchanged county in an incremental trend run gets an empty delta report and a zero trend summary
+    def test_unchanged_county(self):
+        with tempfile.TemporaryDirectory() as tmp_dir, patch('VoterRoll.COLORADO_VOTERS_MOVED_DIR', tmp_dir):
+            trend_dir = os.path.join(tmp_dir, 'trend')
+            save_snapshot(os.path.join(trend_dir, 'Adams_5_voter_ids.npz'), np.array([1, 2, 3]), '20240601NCOA01to02_Adams_5.xlsx')
+            job = CountyJob('Adams_5')
+            job.result['status'], job.done = 'unchanged', True
+            result = finish_county(job, pd.DataFrame(columns=['VOTER_ID', 'MAILING_STATE', 'MAILING_COUNTRY']), trend_dir=trend_dir)
+            self.assertEqual(result['status'], 'unchanged')
+            self.assertEqual({key: result['trend'][key] for key in ('previous', 'current', 'added', 'removed')}, {'previous': 3, 'current': 3, 'added': 0, 'removed': 0})
+            ws = load_workbook(result['trend']['delta_file']).active
+            self.assertEqual([[cell.value for cell in row] for row in ws.iter_rows()], [['CHANGE', 'VOTER_ID', 'MAILING_STATE', 'MAILING_COUNTRY']])
+
+# logging class
+class TestLogging(unittest.TestCase):
+
+    def setUp(self):
+        self.records = queue.SimpleQueue()
+        patcher = patch.object(queueHandler, 'queue', self.records)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(set_log_level, queueHandler.level)
+
+    # records are queued with the county and stage they were logged in, and formatted on the listener thread
+    # per-stage metrics are logged at DEBUG
+    def test_context_fields(self):
+        with log_context(county='Adams_5'), StageRecorder('Adams_5'), stage('match'):
+            pass
+        self.assertTrue(self.records.empty())
+        set_log_level('DEBUG')
+        with log_context(county='Adams_5'), StageRecorder('Adams_5'), stage('match'):
+            logger.info('Matched %d records', 3)
+        logger.info('Finished')
+        records = [self.records.get_nowait() for _ in range(3)]
+        self.assertEqual([(r.county, r.stage, r.getMessage()) for r in records],
+                         [('Adams_5', 'match', 'Matched 3 records'), ('Adams_5', 'match', records[1].msg), ('-', '-', 'Finished')])
+        self.assertTrue(records[1].msg.startswith('Stage match for Adams_5'))
+
+    # below the level nothing is queued; warnings still reach the logger for the per-county manifest
+    def test_level(self):
+        set_log_level('ERROR')
+        self.assertFalse(logger.isEnabledFor(logging.INFO))
+        self.assertTrue(logger.isEnabledFor(logging.WARNING))
+        logger.warning('not written')
+        self.assertTrue(self.records.empty())
+        with self.assertRaises(ValueError):
+            set_log_level('LOUD')
+
+    # an unknown VOTERROLL_LOG_LEVEL falls back to INFO instead of failing the import
+    def test_unknown_env_level(self):
+        env  = {**os.environ, 'DOCKER_ENV': '1', 'VOTERROLL_LOG_LEVEL': 'verbose'}
+        code = 'from utilities.loggerUtilVoterRoll import LOG_LEVEL, queueHandler; print(LOG_LEVEL, queueHandler.level)'
+        run  = subprocess.run([sys.executable, '-c', code], env=env, cwd=BASE_DIR, capture_output=True, text=True)
+        self.assertEqual(run.returncode, 0, run.stderr)
+        self.assertIn('WARNING: unknown VOTERROLL_LOG_LEVEL VERBOSE', run.stdout)
+        self.assertTrue(run.stdout.strip().endswith('INFO 20'))
 
 if __name__ == '__main__':
     unittest.main()
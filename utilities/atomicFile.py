@@ -0,0 +1,22 @@
+# Standard library imports
+import os
+import uuid
+from   contextlib import contextmanager
+from   typing     import Iterator
+
+# temporary path next to file_path; it is on the same filesystem, so os.replace is atomic
+def temp_path_for(file_path: str) -> str:
+    directory, name = os.path.split(os.path.abspath(file_path))
+    return os.path.join(directory, f".{name}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp")
+
+# yield a temporary path to write to; on success it atomically replaces file_path, on failure it is removed
+# readers therefore only ever see the previous file or the complete new one, never a half-written file
+@contextmanager
+def atomic_path(file_path: str) -> Iterator[str]:
+    tmp_path = temp_path_for(file_path)
+    try:
+        yield tmp_path
+        os.replace(tmp_path, file_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -0,0 +1,169 @@
+# Standard library imports
+from   copy   import copy
+from   typing import Dict, Iterator, List, Tuple
+
+# Third-party imports
+import numpy  as np
+import pandas as pd
+from   openpyxl                   import Workbook
+from   openpyxl.cell              import WriteOnlyCell
+from   openpyxl.styles            import PatternFill
+from   openpyxl.styles.cell_style import StyleArray
+from   openpyxl.utils             import get_column_letter
+from   pandas                     import DataFrame
+
+# Local application/library specific imports
+from utilities.atomicFile      import atomic_path
+from utilities.instrumentation import stage
+
+# fill styles for shades of grey - from light to dark
+GAINSBORO_GREY = "DCDCDC"  # voters who moved out-of-state
+SILVER_GREY    = "C0C0C0"  # voters who moved out-of-country
+DARK_GREY      = "A9A9A9"  # no value in MAILING_STATE or MAILING_COUNTRY
+
+# extra characters added to the longest value in a column
+COLUMN_PADDING = 5
+
+# rows are converted to Python values and styled one chunk at a time
+CHUNK_ROWS  = 10000
+
+# outputs with at least this many rows are written with the streaming (write-only) writer
+STREAM_ROWS = 10000
+
+# solid fill for a hex RGB color
+def solid_fill(color: str) -> PatternFill:
+    return PatternFill(start_color=color, end_color=color, fill_type="solid")
+
+# True where a cell has a value; None, NaN and empty strings count as empty, as they do in Excel
+def _has_value(series: pd.Series) -> np.ndarray:
+    return (series.notna() & (series.astype(str) != "")).to_numpy()
+
+# fill color per row by voters who moved out-of-state or out-of-country
+def row_fill_colors(df: DataFrame) -> List[str]:
+    if "MAILING_STATE" not in df.columns or "MAILING_COUNTRY" not in df.columns:
+        raise KeyError("MAILING_STATE or MAILING_COUNTRY column not found.")
+    out_of_state   = _has_value(df["MAILING_STATE"])
+    out_of_country = _has_value(df["MAILING_COUNTRY"])
+    return np.select([out_of_state, out_of_country], [GAINSBORO_GREY, SILVER_GREY], default=DARK_GREY).tolist()
+
+# running maximum value length per column, updated one chunk of rows at a time
+class ColumnWidthTracker:
+    def __init__(self, columns) -> None:
+        self.max_lengths: List[int] = [len(str(column)) for column in columns]  # header included
+
+    def update(self, df: DataFrame) -> None:
+        for position, column in enumerate(df.columns):
+            values = df[column].dropna()
+            if not values.empty:
+                self.max_lengths[position] = max(self.max_lengths[position], int(values.astype(str).str.len().max()))
+
+    # autofit column widths: longest value in each column plus padding
+    def widths(self) -> Dict[str, int]:
+        return {get_column_letter(position): length + COLUMN_PADDING for position, length in enumerate(self.max_lengths, start=1)}
+
+# autofit column widths for a whole DataFrame
+def column_widths(df: DataFrame, chunk_rows: int = CHUNK_ROWS) -> Dict[str, int]:
+    tracker = ColumnWidthTracker(df.columns)
+    for start in range(0, len(df), chunk_rows):
+        tracker.update(df.iloc[start:start + chunk_rows])
+    return tracker.widths()
+
+# registered cell style per fill color
+# assigning cell.fill re-hashes the fill for every cell; copying a prepared style array is what openpyxl does when it copies cells
+def _fill_styles(wb: Workbook) -> Dict[str, StyleArray]:
+    styles: Dict[str, StyleArray] = {}
+    for color in (GAINSBORO_GREY, SILVER_GREY, DARK_GREY):
+        style         = StyleArray()
+        style.fillId  = wb._fills.add(solid_fill(color))
+        styles[color] = style
+    return styles
+
+# DataFrame rows as lists of Python values, with NaN/NaT replaced by None (empty cells), paired with each row's fill color
+# only chunk_rows rows are held as Python objects at a time
+def _styled_rows(df: DataFrame, chunk_rows: int = CHUNK_ROWS) -> Iterator[Tuple[list, str]]:
+    for start in range(0, len(df), chunk_rows):
+        chunk  = df.iloc[start:start + chunk_rows]
+        colors = row_fill_colors(chunk)
+        values = chunk.astype(object).where(chunk.notna(), None)
+        for row, color in zip(values.itertuples(index=False, name=None), colors):
+            yield list(row), color
+
+# write df to file_path as a formatted workbook in one pass:
+# frozen header row, autofit columns and grey row fills by MAILING_STATE/MAILING_COUNTRY
+def write_formatted_workbook(df: DataFrame, file_path: str) -> None:
+    row_fill_colors(df.iloc[0:0])  # fail before any work if the mailing columns are missing
+
+    wb = Workbook()
+    ws = wb.active
+    styles = _fill_styles(wb)
+    with stage("format_rows", rows=len(df)):
+        ws.append([str(column) for column in df.columns])
+        for row_number, (row, color) in enumerate(_styled_rows(df), start=2):
+            style = styles[color]
+            for column_number, value in enumerate(row, start=1):  # every cell gets the fill, empty ones included
+                cell        = ws.cell(row=row_number, column=column_number, value=value)
+                cell._style = copy(style)
+
+    with stage("format_widths"):
+        ws.freeze_panes = "A2"
+        for column_letter, width in column_widths(df).items():
+            ws.column_dimensions[column_letter].width = width
+    with stage("save"):
+        wb.save(file_path)
+
+# stream df into a write-only worksheet: frozen header row, autofit columns and grey row fills
+# column widths are written before the first row, so they come from a chunked pass of the width tracker
+def _stream_sheet(ws, df: DataFrame, styles: Dict[str, StyleArray]) -> None:
+    with stage("format_widths"):
+        ws.freeze_panes = "A2"
+        for column_letter, width in column_widths(df).items():
+            ws.column_dimensions[column_letter].width = width
+
+    with stage("format_rows", rows=len(df)):  # rows are streamed to disk here
+        ws.append([str(column) for column in df.columns])
+        for row, color in _styled_rows(df):
+            style = styles[color]
+            cells = []
+            for value in row:  # every cell gets the fill, empty ones included
+                cell        = WriteOnlyCell(ws, value=value)
+                cell._style = copy(style)
+                cells.append(cell)
+            ws.append(cells)
+
+# same output as write_formatted_workbook, built with openpyxl's write-only mode
+# rows are streamed to disk as they are emitted, so memory stays flat regardless of the number of rows
+def write_streaming_workbook(df: DataFrame, file_path: str) -> None:
+    row_fill_colors(df.iloc[0:0])  # fail before any work if the mailing columns are missing
+
+    wb = Workbook(write_only=True)
+    _stream_sheet(wb.create_sheet(), df, _fill_styles(wb))
+    with stage("save"):
+        wb.save(file_path)
+
+# streaming workbook with one formatted sheet per frame, titled by its key (at most 31 characters, as Excel requires)
+def write_sheets_workbook(frames: Dict[str, DataFrame], file_path: str) -> None:
+    for df in frames.values():
+        row_fill_colors(df.iloc[0:0])
+
+    wb = Workbook(write_only=True)
+    styles = _fill_styles(wb)
+    for title, df in frames.items():
+        _stream_sheet(wb.create_sheet(title=title[:31]), df, styles)
+    with stage("save"):
+        wb.save(file_path)
+
+# write a county output, switching to the streaming writer for large outputs
+# the workbook is written to a temporary file and renamed over file_path, so a half-written output is never visible
+# stream_rows = 0 always streams
+def write_county_workbook(df: DataFrame, file_path: str, stream_rows: int = STREAM_ROWS) -> None:
+    with atomic_path(file_path) as tmp_path:
+        if len(df) >= stream_rows:
+            write_streaming_workbook(df, tmp_path)
+        else:
+            write_formatted_workbook(df, tmp_path)
+
+# for testing the module
+if __name__ == "__main__":
+    demo_df: DataFrame = pd.DataFrame({"VOTER_ID": [1, 2, 3], "MAILING_STATE": ["TX", None, None], "MAILING_COUNTRY": [None, "CANADA", None]})
+    print(row_fill_colors(demo_df))
+    print(column_widths(demo_df))
@@ -0,0 +1,151 @@
+# Standard library imports
+import json
+import os
+import re
+from   contextlib import contextmanager
+from   datetime   import date
+from   typing     import Any, Dict, Iterable, Iterator, List, Optional
+
+# Local application/library specific imports
+from utilities.atomicFile          import atomic_path
+from utilities.inputReader         import FORMAT_PREFERENCE, format_available, readable_formats
+from utilities.loggerUtilVoterRoll import logger
+
+# index file format version; bump when the entry layout changes so old indexes are ignored
+INDEX_VERSION = 2
+
+# filename date patterns, tried in order; named groups year and month are required, day is optional
+# NCOA drops: 20240601NCOA01to02_Adams_5.xlsx, or NCOA_20240601.xlsx
+NCOA_PATTERNS: List[str] = [
+    r"^(?P<year>\d{4})(?P<month>\d{2})(?P<day>\d{2})NCOA",
+    r"NCOA\D*(?P<year>\d{4})[-_]?(?P<month>\d{2})[-_]?(?P<day>\d{2})",
+]
+# voter roll drops: VR2024_05_Adams_5.xlsx, or VR_20240501.xlsx
+VR_PATTERNS: List[str] = [
+    r"^VR_?(?P<year>\d{4})[-_]?(?P<month>\d{2})(?:[-_]?(?P<day>\d{2})(?!\d))?",
+]
+
+# check user-supplied date patterns before any county is scanned: each must compile and have year and month groups
+# raises ValueError naming the first bad pattern
+def check_date_patterns(patterns: Iterable[str]) -> None:
+    for pattern in patterns:
+        try:
+            groups = re.compile(pattern).groupindex
+        except re.error as e:
+            raise ValueError(f"invalid date pattern {pattern!r}: {e}") from e
+        missing = [group for group in ("year", "month") if group not in groups]
+        if missing:
+            raise ValueError(f"date pattern {pattern!r} has no {' or '.join(f'(?P<{group}>...)' for group in missing)} group")
+
+# True for an NCOA or voter roll (VR) input file name in a supported format (.xlsx, .csv, .parquet or .feather)
+def is_ncoa_file(file_name: str) -> bool:
+    return "NCOA" in file_name and file_name.lower().endswith(FORMAT_PREFERENCE)
+
+def is_vr_file(file_name: str) -> bool:
+    return file_name.startswith("VR") and file_name.lower().endswith(FORMAT_PREFERENCE)
+
+# snapshot date of a file name as YYYY-MM-DD, from the first pattern that matches; None when no pattern matches
+def snapshot_date(file_name: str, patterns: Iterable[str]) -> Optional[str]:
+    for pattern in patterns:
+        match = re.search(pattern, file_name)
+        if not match:
+            continue
+        try:
+            return date(int(match["year"]), int(match["month"]), int(match.groupdict().get("day") or 1)).isoformat()
+        except ValueError:  # e.g. month 13: try the next pattern
+            continue
+    return None
+
+# snapshots of one kind, newest first; files without a date in their name sort last
+# a snapshot delivered in several formats (same name, different extension) is listed once, in its fastest readable format
+def _snapshots(file_names: Iterable[str], patterns: Iterable[str]) -> List[Dict[str, Optional[str]]]:
+    fastest: Dict[str, str] = {}
+    for file_name in file_names:
+        stem, extension = os.path.splitext(file_name)
+        if not format_available(extension.lower()):
+            continue
+        if stem not in fastest or FORMAT_PREFERENCE.index(extension.lower()) < FORMAT_PREFERENCE.index(os.path.splitext(fastest[stem])[1].lower()):
+            fastest[stem] = file_name
+    snapshots = [{"file": file_name, "date": snapshot_date(file_name, patterns)} for file_name in fastest.values()]
+    snapshots.sort(key=lambda s: (s["date"] or "", s["file"]), reverse=True)
+    return snapshots
+
+# index entry for a county directory from its file names: NCOA and VR snapshots, newest first
+def index_entry(file_names: Iterable[str], ncoa_patterns: Iterable[str] = NCOA_PATTERNS, vr_patterns: Iterable[str] = VR_PATTERNS,
+                dir_mtime_ns: Optional[int] = None) -> Dict[str, Any]:
+    file_names = [f for f in file_names if not f.startswith(("~$", "."))]  # Excel lock files and hidden temporary files
+    return {
+        "dir_mtime_ns": dir_mtime_ns,
+        "patterns":     {"ncoa": list(ncoa_patterns), "vr": list(vr_patterns)},
+        "formats":      readable_formats(),
+        "ncoa":         _snapshots([f for f in file_names if is_ncoa_file(f)], ncoa_patterns),
+        "vr":           _snapshots([f for f in file_names if is_vr_file(f)],   vr_patterns),
+    }
+
+# index entry for a county directory, reusing the previous entry when the directory and patterns are unchanged
+# adding, removing or renaming a file changes the directory modification time; otherwise the directory is not scanned
+# installing pyarrow changes the readable formats and forces a rescan
+# a rescan is one os.scandir pass for both kinds of input
+def county_files(sub_dir_path: str, previous: Optional[Dict[str, Any]] = None,
+                 ncoa_patterns: Iterable[str] = NCOA_PATTERNS, vr_patterns: Iterable[str] = VR_PATTERNS) -> Dict[str, Any]:
+    dir_mtime_ns = os.stat(sub_dir_path).st_mtime_ns
+    patterns     = {"ncoa": list(ncoa_patterns), "vr": list(vr_patterns)}
+    if (previous and previous.get("dir_mtime_ns") == dir_mtime_ns and previous.get("patterns") == patterns and
+        previous.get("formats") == readable_formats()):
+        return previous
+
+    file_names: List[str] = [entry.name for entry in os.scandir(sub_dir_path) if entry.is_file()]
+    entry = index_entry(file_names, ncoa_patterns, vr_patterns, dir_mtime_ns)
+    unreadable = [f for f in file_names if (is_ncoa_file(f) or is_vr_file(f)) and not format_available(os.path.splitext(f)[1].lower())]
+    if unreadable:
+        logger.warning(f"WARNING: pyarrow is not installed; ignoring {', '.join(unreadable)} in {sub_dir_path}.")
+    for kind in ("ncoa", "vr"):
+        undated = [s["file"] for s in entry[kind] if s["date"] is None]
+        if undated:
+            logger.warning(f"WARNING: no date found in {kind.upper()} file name(s) {', '.join(undated)} in {sub_dir_path}; they sort as oldest.")
+    return entry
+
+# wrap this tool's own writes into a county directory (its voters_moved output), so they do not force a rescan next run:
+# when the directory is unchanged since the entry was scanned, the entry moves forward to the directory time after the write
+@contextmanager
+def writing_into(entry: Optional[Dict[str, Any]], sub_dir_path: str) -> Iterator[None]:
+    if not entry or entry.get("dir_mtime_ns") is None:
+        yield
+        return
+    unchanged = os.stat(sub_dir_path).st_mtime_ns == entry["dir_mtime_ns"]
+    yield
+    if unchanged:
+        entry["dir_mtime_ns"] = os.stat(sub_dir_path).st_mtime_ns
+
+# most recent snapshot file of a kind ("ncoa" or "vr"), or None
+def latest_file(entry: Dict[str, Any], kind: str) -> Optional[str]:
+    return entry[kind][0]["file"] if entry.get(kind) else None
+
+# every snapshot of a kind, oldest first, for trend runs
+def file_history(entry: Dict[str, Any], kind: str) -> List[Dict[str, Optional[str]]]:
+    return list(reversed(entry.get(kind, [])))
+
+# load the persistent file index; a missing or unreadable index means every county directory is scanned
+def load_file_index(index_file: str) -> Dict[str, Dict[str, Any]]:
+    if not os.path.exists(index_file):
+        return {}
+    try:
+        with open(index_file, "r", encoding="utf-8") as f:
+            index = json.load(f)
+        if index.get("version") != INDEX_VERSION:
+            logger.warning(f"WARNING: ignoring file index {index_file} with unsupported version {index.get('version')}")
+            return {}
+        return index.get("counties", {})
+    except Exception as e:
+        logger.warning(f"WARNING: ignoring unreadable file index {index_file}: {e}")
+        return {}
+
+# write the file index atomically
+def save_file_index(counties: Dict[str, Dict[str, Any]], index_file: str) -> None:
+    try:
+        with atomic_path(index_file) as tmp_path:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": INDEX_VERSION, "counties": counties}, f, indent=2)
+        logger.info(f"Wrote file index {index_file}")
+    except Exception as e:
+        logger.error(f"ERROR: failed to write file index {index_file}: {e}")
@@ -0,0 +1,115 @@
+# Standard library imports
+import hashlib
+import json
+import os
+from   typing import Any, Callable, Dict, List, Optional
+
+# Third-party imports
+import pandas as pd
+from   pandas import DataFrame
+
+# Local application/library specific imports
+from utilities.atomicFile          import atomic_path
+from utilities.loggerUtilVoterRoll import logger
+
+# cache defaults
+CACHE_SUFFIX    = ".pkl"
+CACHE_MAX_BYTES = 2 * 1024 ** 3  # 2 GB
+HASH_BLOCK_SIZE = 1024 ** 2      # read files 1 MB at a time when hashing
+
+# fingerprint of a file: absolute path, size, modification time and content hash
+def file_fingerprint(file_path: str) -> Dict[str, Any]:
+    stat   = os.stat(file_path)
+    digest = hashlib.blake2b(digest_size=20)
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return {
+        "path":     os.path.abspath(file_path),
+        "size":     stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "hash":     digest.hexdigest(),
+    }
+
+# empty cache statistics
+def new_cache_stats() -> Dict[str, int]:
+    return {"hits": 0, "misses": 0, "bytes_saved": 0, "bytes_written": 0, "evictions": 0}
+
+# add the counters in stats to totals
+def merge_cache_stats(totals: Dict[str, int], stats: Dict[str, int]) -> Dict[str, int]:
+    for key, value in stats.items():
+        totals[key] = totals.get(key, 0) + value
+    return totals
+
+# cache of parsed input frames, stored as pickled DataFrames keyed by source file fingerprint
+# entries are written atomically and evicted least-recently-used first once the cache exceeds max_bytes,
+# so several worker processes can share one cache directory
+class InputCache:
+    def __init__(self, cache_dir: str, max_bytes: int = CACHE_MAX_BYTES) -> None:
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.stats     = new_cache_stats()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    # cache file for a fingerprint plus the reader options that shaped the frame
+    def _entry_path(self, fingerprint: Dict[str, Any], options: Dict[str, Any]) -> str:
+        key = hashlib.blake2b(json.dumps([fingerprint, options], sort_keys=True, default=str).encode("utf-8"), digest_size=20).hexdigest()
+        return os.path.join(self.cache_dir, key + CACHE_SUFFIX)
+
+    # return the parsed frame for file_path, calling reader(file_path, **options) only on a cache miss
+    def read(self, file_path: str, reader: Callable[..., DataFrame] = pd.read_excel, **options: Any) -> DataFrame:
+        fingerprint = file_fingerprint(file_path)
+        entry_path  = self._entry_path(fingerprint, {"reader": getattr(reader, "__name__", str(reader)), **options})
+
+        if os.path.exists(entry_path):
+            try:
+                df: DataFrame = pd.read_pickle(entry_path)
+                os.utime(entry_path)  # mark as recently used
+                self.stats["hits"]        += 1
+                self.stats["bytes_saved"] += fingerprint["size"]
+                logger.debug(f"Cache hit for {os.path.basename(file_path)}")
+                return df
+            except Exception as e:
+                logger.warning(f"WARNING: ignoring unreadable cache entry {entry_path}: {e}")
+
+        df = reader(file_path, **options)
+        self.stats["misses"] += 1
+        logger.debug(f"Cache miss for {os.path.basename(file_path)}")
+        self._store(df, entry_path)
+        return df
+
+    # write an entry through a temporary file so readers never see a partial pickle
+    def _store(self, df: DataFrame, entry_path: str) -> None:
+        try:
+            with atomic_path(entry_path) as tmp_path:
+                df.to_pickle(tmp_path, protocol=5)
+            self.stats["bytes_written"] += os.path.getsize(entry_path)
+        except Exception as e:
+            logger.warning(f"WARNING: failed to write cache entry {entry_path}: {e}")
+            return
+        self.evict()
+
+    # remove least recently used entries until the cache fits in max_bytes
+    def evict(self) -> None:
+        entries: List[os.DirEntry] = [e for e in os.scandir(self.cache_dir) if e.name.endswith(CACHE_SUFFIX)]
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        total = sum(e.stat().st_size for e in entries)
+        for entry in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+                total -= size
+                self.stats["evictions"] += 1
+            except OSError:  # already evicted by another worker, or still open on Windows
+                pass
+
+# log a cache statistics report
+def log_cache_stats(stats: Dict[str, int], cache_dir: Optional[str] = None) -> None:
+    lookups  = stats.get("hits", 0) + stats.get("misses", 0)
+    hit_rate = stats.get("hits", 0) / lookups * 100 if lookups else 0.0
+    location = f" ({cache_dir})" if cache_dir else ""
+    logger.info(f"Input cache{location}: {stats.get('hits', 0)} hits, {stats.get('misses', 0)} misses ({hit_rate:.0f}% hit rate), "
+                f"{stats.get('bytes_saved', 0) / 1024 ** 2:.1f} MB of Excel parsing skipped, "
+                f"{stats.get('bytes_written', 0) / 1024 ** 2:.1f} MB written, {stats.get('evictions', 0)} evictions")
@@ -0,0 +1,69 @@
+# Standard library imports
+import os
+from   typing import Any, Callable, Dict, List, Optional
+
+# Third-party imports
+import pandas as pd
+from   pandas import DataFrame
+
+# pyarrow is optional; without it Parquet and Feather inputs are not read
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+# rows parsed per CSV chunk
+CSV_CHUNK_ROWS = 100000
+
+# supported input formats, fastest to parse first; when one snapshot exists in several formats, the first readable one is used
+FORMAT_PREFERENCE = (".parquet", ".feather", ".csv", ".xlsx")
+ARROW_FORMATS     = (".parquet", ".feather")
+
+# formats worth caching as parsed frames; Parquet and Feather already load about as fast as a cache entry
+CACHED_FORMATS    = (".xlsx", ".csv")
+
+# True when this environment can read files with the given extension
+def format_available(extension: str) -> bool:
+    return extension in FORMAT_PREFERENCE and (extension not in ARROW_FORMATS or pyarrow is not None)
+
+# readable input extensions, fastest first
+def readable_formats() -> List[str]:
+    return [extension for extension in FORMAT_PREFERENCE if format_available(extension)]
+
+# CSV in chunks of CSV_CHUNK_ROWS; columns are parsed as text unless dtype says otherwise, so nothing is inferred
+# (ZIP codes keep their leading zeros). convert types each chunk as it is parsed (e.g. whole numbers to integers),
+# so only one chunk of those columns is ever held as text
+def read_csv_chunked(file_path: str, columns: Optional[List[str]] = None, dtype: Any = str,
+                     convert: Optional[Callable[[DataFrame], DataFrame]] = None) -> DataFrame:
+    chunks = pd.read_csv(file_path, usecols=columns, dtype=dtype, chunksize=CSV_CHUNK_ROWS)
+    return pd.concat([convert(chunk) if convert else chunk for chunk in chunks], ignore_index=True)
+
+def _read_excel(file_path: str, columns: Optional[List[str]] = None) -> DataFrame:
+    return pd.read_excel(file_path, usecols=columns)
+
+def _read_parquet(file_path: str, columns: Optional[List[str]] = None) -> DataFrame:
+    return pd.read_parquet(file_path, columns=columns)
+
+def _read_feather(file_path: str, columns: Optional[List[str]] = None) -> DataFrame:
+    return pd.read_feather(file_path, columns=columns)
+
+# reader per input extension
+READERS: Dict[str, Callable[..., DataFrame]] = {
+    ".xlsx":    _read_excel,
+    ".csv":     read_csv_chunked,
+    ".parquet": _read_parquet,
+    ".feather": _read_feather,
+}
+
+# read an NCOA or VR input by its extension; columns limits the columns loaded (all when None)
+# convert is applied to each CSV chunk, or once to the whole frame for the other formats
+def read_input_file(file_path: str, columns: Optional[List[str]] = None, convert: Optional[Callable[[DataFrame], DataFrame]] = None) -> DataFrame:
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension not in READERS:
+        raise ValueError(f"unsupported input format {extension} for {os.path.basename(file_path)}")
+    if not format_available(extension):
+        raise ValueError(f"pyarrow is required to read {os.path.basename(file_path)}")
+    if extension == ".csv":
+        return read_csv_chunked(file_path, columns=columns, convert=convert)
+    df = READERS[extension](file_path, columns=columns)
+    return convert(df) if convert else df
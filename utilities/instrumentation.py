@@ -0,0 +1,133 @@
+# Standard library imports
+import functools
+import json
+import sys
+import time
+import tracemalloc
+from   contextlib  import contextmanager
+from   contextvars import ContextVar
+from   typing      import Any, Callable, Dict, Iterator, List, Optional
+
+# Local application/library specific imports
+from utilities.atomicFile          import atomic_path
+from utilities.loggerUtilVoterRoll import log_context, logger
+
+# resource is not available on Windows; max RSS is then reported as None
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# recorder of the county currently being processed in this thread/context
+_current_recorder: ContextVar[Optional["StageRecorder"]] = ContextVar("current_recorder", default=None)
+
+# process high-water mark resident set size in MB (ru_maxrss is KB on Linux, bytes on macOS)
+def max_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / 1024 ** 2 if sys.platform == "darwin" else rss / 1024, 1)
+
+# start tracing Python allocations so each stage reports its own peak memory
+# tracing slows allocation-heavy code, so it is opt-in
+def enable_memory_tracing() -> None:
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+# wall time, CPU time, peak memory and row counts for the stages of one county (or of the whole run)
+# use as a context manager to make it the current recorder, then wrap stages in stage()
+class StageRecorder:
+    def __init__(self, county: str) -> None:
+        self.county: str                  = county
+        self.stages: List[Dict[str, Any]] = []
+        self._open:  List[Dict[str, Any]] = []  # stack of running stages, innermost last
+        self._token  = None
+
+    def __enter__(self) -> "StageRecorder":
+        self._token = _current_recorder.set(self)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        _current_recorder.reset(self._token)
+
+    # time one stage; the yielded metrics dictionary can be given a row count by the caller
+    @contextmanager
+    def stage(self, name: str, rows: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        metrics: Dict[str, Any] = {"county": self.county, "stage": name, "rows": rows, "_peak": 0}
+        tracing = tracemalloc.is_tracing()
+        if tracing:  # bank the parent's peak so far, then measure this stage from a fresh peak
+            if self._open:
+                self._open[-1]["_peak"] = max(self._open[-1]["_peak"], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        self._open.append(metrics)
+        wall_start = time.perf_counter()
+        cpu_start  = time.process_time()
+        with log_context(stage=name):  # records logged during the stage, and its metrics record, carry the stage name
+            try:
+                yield metrics
+            finally:
+                metrics["wall_s"] = round(time.perf_counter() - wall_start, 4)
+                metrics["cpu_s"]  = round(time.process_time() - cpu_start, 4)
+                self._open.pop()
+                peak = metrics.pop("_peak")
+                if tracing:
+                    peak = max(peak, tracemalloc.get_traced_memory()[1])
+                    if self._open:
+                        self._open[-1]["_peak"] = max(self._open[-1]["_peak"], peak)
+                    tracemalloc.reset_peak()
+                metrics["peak_mb"]    = round(peak / 1024 ** 2, 1) if tracing else None
+                metrics["max_rss_mb"] = max_rss_mb()
+                self.stages.append(metrics)
+                logger.debug(f"Stage {name} for {self.county}: {metrics['wall_s']:.3f}s wall, {metrics['cpu_s']:.3f}s CPU"
+                             + (f", {metrics['rows']} rows" if metrics["rows"] is not None else ""),
+                             extra={"stage_metrics": metrics})
+
+    # wall seconds per stage, summed when a stage runs more than once
+    def timings(self) -> Dict[str, float]:
+        timings: Dict[str, float] = {}
+        for metrics in self.stages:
+            timings[metrics["stage"]] = round(timings.get(metrics["stage"], 0.0) + metrics["wall_s"], 3)
+        return timings
+
+# time a stage against the current recorder; without one (e.g. a direct library call) this does nothing
+@contextmanager
+def stage(name: str, rows: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    recorder = _current_recorder.get()
+    if recorder is None:
+        yield {"stage": name, "rows": rows}
+        return
+    with recorder.stage(name, rows) as metrics:
+        yield metrics
+
+# decorator form of stage()
+def instrumented(name: str) -> Callable:
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# per-stage totals over a list of stage metrics: count, wall, CPU, rows and the largest peak
+def summarize_stages(stages: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    summary: Dict[str, Dict[str, Any]] = {}
+    for metrics in stages:
+        totals = summary.setdefault(metrics["stage"], {"count": 0, "wall_s": 0.0, "cpu_s": 0.0, "rows": 0, "peak_mb": None})
+        totals["count"]  += 1
+        totals["wall_s"]  = round(totals["wall_s"] + metrics["wall_s"], 4)
+        totals["cpu_s"]   = round(totals["cpu_s"]  + metrics["cpu_s"],  4)
+        totals["rows"]   += metrics["rows"] or 0
+        if metrics.get("peak_mb") is not None:
+            totals["peak_mb"] = max(totals["peak_mb"] or 0.0, metrics["peak_mb"])
+    return dict(sorted(summary.items(), key=lambda item: item[1]["wall_s"], reverse=True))
+
+# write the machine-readable run report: run information, per-stage totals (slowest first) and every stage of every county
+def write_run_report(report_file: str, run_info: Dict[str, Any], stages: List[Dict[str, Any]]) -> None:
+    try:
+        with atomic_path(report_file) as tmp_path:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"run": run_info, "stage_totals": summarize_stages(stages), "stages": stages}, f, indent=2)
+        logger.info(f"Wrote run report {report_file}")
+    except Exception as e:
+        logger.error(f"ERROR: failed to write run report {report_file}: {e}")
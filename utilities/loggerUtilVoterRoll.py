@@ -1,23 +1,56 @@
 # Standard library imports
+import atexit
 import colorlog
 import logging
+import multiprocessing
 import os
-import platform
+import queue
 import sys
-from logging.handlers import RotatingFileHandler
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Any, Dict, Iterator, Union
 from pythonjsonlogger import jsonlogger
 
+# log level of the stream and file output; override with VOTERROLL_LOG_LEVEL or VoterRoll.py --log-level
+LOG_LEVEL = os.environ.get("VOTERROLL_LOG_LEVEL", "INFO").upper()
+
+# log file; ~ is %USERPROFILE% on Windows and $HOME elsewhere. override with VOTERROLL_LOG_FILE
+LOG_FILE = os.environ.get("VOTERROLL_LOG_FILE") or os.path.join(os.path.expanduser("~"), "VoterRoll", "logs", "logs.txt")
+
+# context fields added to every record: the county and stage being processed in this thread/context, "-" outside of one
+LOG_CONTEXT_FIELDS = ("county", "stage")
+_log_context: ContextVar[Dict[str, str]] = ContextVar("log_context", default={})
+
+# set county and/or stage for records logged inside the block; nested blocks add to or override the outer fields
+@contextmanager
+def log_context(**fields: str) -> Iterator[None]:
+    token = _log_context.set({**_log_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _log_context.reset(token)
+
+# stamps the context fields on each record in the logging thread, before it is queued
+class ContextFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = _log_context.get()
+        for field in LOG_CONTEXT_FIELDS:
+            setattr(record, field, context.get(field, "-"))
+        return True
+
 # set logger name = module name
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)  # set log level (DEBUG, INFO, WARNING, ERROR, CRITICAL)
+
+# Output handlers. They run on the listener thread, so formatting and writing never block the processing path
+outputHandlers = []
 
 # Stream handler. date format is ISO-8601 (YYYY-MM-DDTHH:MM:SS)
 try:
     streamHandler = colorlog.StreamHandler(stream=sys.stdout)  # send logs to stdout instead of stderr
-    fmtStream = colorlog.ColoredFormatter("%(name)s: %(asctime)s | %(levelname)s | %(filename)s:%(lineno)s | %(process)d >>> %(message)s")  # stream format
+    fmtStream = colorlog.ColoredFormatter("%(name)s: %(asctime)s | %(levelname)s | %(filename)s:%(lineno)s | %(process)d | %(county)s:%(stage)s >>> %(message)s")  # stream format
     streamHandler.setFormatter(fmtStream)
-    streamHandler.setLevel(logging.DEBUG)  # set log level (DEBUG, INFO, WARNING, ERROR, CRITICAL)
-    logger.addHandler(streamHandler)
+    outputHandlers.append(streamHandler)
 except Exception as e:
     print(f"ERROR: failed to set up color logging: {e}")
     sys.exit(1)
@@ -26,27 +59,66 @@ except Exception as e:
 # Only add file logging if not running inside Docker
 if not os.environ.get('DOCKER_ENV'):
     try:
-        # Identify the platform
-        if platform.system() == 'Windows':  # Windows
-            logs_file = os.path.join(os.environ['USERPROFILE'], 'VoterRoll', 'logs', 'logs.txt')
-        else:
-            raise ValueError("ERROR: unsupported platform")
-        
-        fileHandler = RotatingFileHandler(logs_file, backupCount=5, maxBytes=50000000)  # five log file rotations; rotate log filename at 50 Mb; delete oldest file
-        
+        os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
+        fileHandler = RotatingFileHandler(LOG_FILE, backupCount=5, maxBytes=50000000, delay=True)  # five log file rotations; rotate log filename at 50 Mb; delete oldest file; opened on first record
+
         fmtJson = jsonlogger.JsonFormatter(
-            "%(name)s %(asctime)s %(levelname)s %(filename)s %(lineno)s %(process)d %(message)s",
+            "%(name)s %(asctime)s %(levelname)s %(filename)s %(lineno)s %(process)d %(county)s %(stage)s %(message)s",
             rename_fields={"levelname": "severity", "asctime": "timestamp"},
             datefmt="%Y-%m-%dT%H:%M:%SZ",
         )  # json file format
         fileHandler.setFormatter(fmtJson)
-        fileHandler.setLevel(logging.DEBUG)  # set log level (DEBUG, INFO, WARNING, ERROR, CRITICAL)
-        logger.addHandler(fileHandler)
+        outputHandlers.append(fileHandler)
     except Exception as e:
         print(f"ERROR: failed to set up file logging: {e}")
         sys.exit(1)
 
-# Uncaught exceptions handler. 
+# Queue handler. logging a record only stamps the context fields and puts it on the queue;
+# the listener thread formats and writes it to the output handlers
+logQueue = queue.SimpleQueue()
+queueHandler = QueueHandler(logQueue)
+queueHandler.addFilter(ContextFilter())
+logger.addHandler(queueHandler)
+queueListener = QueueListener(logQueue, *outputHandlers)
+queueListener.start()
+atexit.register(queueListener.stop)  # write out queued records at exit
+
+# set the output log level (name or number)
+# the logger itself stays at WARNING or below, so per-county warnings and errors still reach the run manifest;
+# records below both levels are dropped before any work is done
+def set_log_level(level: Union[str, int]) -> None:
+    level = logging.getLevelName(level.upper()) if isinstance(level, str) else level
+    if not isinstance(level, int):
+        raise ValueError(f"unknown log level {level}")
+    queueHandler.setLevel(level)
+    logger.setLevel(min(level, logging.WARNING))
+
+# an unknown VOTERROLL_LOG_LEVEL falls back to INFO rather than stopping the tool
+try:
+    set_log_level(LOG_LEVEL)
+except ValueError:
+    print(f"WARNING: unknown VOTERROLL_LOG_LEVEL {LOG_LEVEL}; using INFO.")
+    LOG_LEVEL = "INFO"
+    set_log_level(LOG_LEVEL)
+
+# queue for worker processes' records, written by a listener in this process for the duration of the block
+# pass it with the level to log_to_queue as the process pool initializer
+@contextmanager
+def worker_log_queue() -> Iterator[Any]:
+    workerQueue = multiprocessing.Queue()
+    workerListener = QueueListener(workerQueue, *outputHandlers)
+    workerListener.start()
+    try:
+        yield workerQueue
+    finally:
+        workerListener.stop()
+
+# process pool initializer: send this worker's records to the parent's worker_log_queue, at the parent's level
+def log_to_queue(workerQueue: Any, level: int) -> None:
+    queueHandler.queue = workerQueue
+    set_log_level(level)
+
+# Uncaught exceptions handler.
 # log these as CRITICAL.  KeyboardInterrupt is treated as normal termination of the script.
 def handle_unhandled_exception(exc_type, exc_value, exc_traceback) -> None:
     if issubclass(exc_type, KeyboardInterrupt):
@@ -58,8 +130,10 @@ sys.excepthook = handle_unhandled_exception # assign the excepthook to the handl
 # for testing the module
 if __name__ == "__main__":
     # Demonstration of logging at various levels
+    set_log_level("DEBUG")
     logger.debug(   "This is a debug message.")
     logger.info(    "This is an info message.")
-    logger.warning( "This is a warning message.")
+    with log_context(county="Adams_5", stage="match"):
+        logger.warning( "This is a warning message.")
     logger.error(   "This is an error message.")
-    logger.critical("This is a critical message.")
\ No newline at end of file
+    logger.critical("This is a critical message.")
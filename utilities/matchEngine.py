@@ -0,0 +1,64 @@
+# Standard library imports
+from   typing import Iterable, Optional
+
+# Third-party imports
+import pandas as pd
+from   pandas import DataFrame, Series
+
+# column names used to join NCOA records to voter roll (VR) records
+NCOA_VOTER_ID_COL = "VoterID"
+NCOA_STATE_COL    = "NEW State"
+VR_VOTER_ID_COL   = "VOTER_ID"
+HOME_STATE        = "CO"
+
+# the only NCOA columns the match reads; NCOA inputs are loaded with just these
+NCOA_COLUMNS = [NCOA_VOTER_ID_COL, NCOA_STATE_COL]
+
+# coerce NCOA voter ids to the dtype of the VR VOTER_ID column
+# the legacy loop compared with ==, so '123' never matched 123; here both sides are made numeric when one of them already is
+def _align_voter_ids(voter_ids: Series, vr_ids: Series) -> Series:
+    if voter_ids.dtype == vr_ids.dtype:
+        return voter_ids
+    if pd.api.types.is_numeric_dtype(vr_ids.dtype):
+        return pd.to_numeric(voter_ids, errors="coerce")
+    try:
+        return voter_ids.astype(vr_ids.dtype)
+    except (TypeError, ValueError):
+        return voter_ids
+
+# index of VR row positions keyed by VOTER_ID
+# build once per county, then look up any number of voter ids in a single vectorized pass
+class VoterIdIndex:
+    def __init__(self, vr_df: DataFrame) -> None:
+        self.vr_df = vr_df
+        vr_ids     = vr_df[VR_VOTER_ID_COL]
+        if not pd.api.types.is_numeric_dtype(vr_ids.dtype):
+            numeric_ids = pd.to_numeric(vr_ids, errors="coerce")
+            if numeric_ids.notna().sum() == vr_ids.notna().sum():  # every id is numeric, e.g. read from a text column
+                vr_ids = numeric_ids
+        self.voter_ids = vr_ids
+        self._index    = pd.Index(vr_ids)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    # return the VR rows for voter_ids, in voter_ids order; duplicate ids yield duplicate rows, unknown ids are dropped
+    def lookup(self, voter_ids: Iterable) -> DataFrame:
+        voter_ids = _align_voter_ids(Series(voter_ids), self.voter_ids).dropna()
+        if voter_ids.empty or len(self._index) == 0:
+            return self.vr_df.iloc[0:0]
+        positions = self._index.get_indexer_for(voter_ids)
+        positions = positions[positions >= 0]
+        return self.vr_df.iloc[positions]
+
+# NCOA voter ids for voters who moved out of Colorado, in NCOA file order
+def moved_voter_ids(ncoa_df: DataFrame) -> Series:
+    moved = ncoa_df[ncoa_df[NCOA_STATE_COL] != HOME_STATE]
+    return moved[NCOA_VOTER_ID_COL]
+
+# semi-join NCOA out-of-state movers against the voter roll
+# produces the same rows, in the same order, as concatenating vr_df[vr_df['VOTER_ID'] == voter_id] for each NCOA row
+def match_moved_voters(ncoa_df: DataFrame, vr_df: DataFrame, index: Optional[VoterIdIndex] = None) -> DataFrame:
+    if index is None:
+        index = VoterIdIndex(vr_df)
+    return index.lookup(moved_voter_ids(ncoa_df)).reset_index(drop=True)
@@ -0,0 +1,86 @@
+# Standard library imports
+import json
+import os
+from   typing import Any, Dict, Optional
+
+# Local application/library specific imports
+from utilities.atomicFile          import atomic_path
+from utilities.inputCache          import file_fingerprint
+from utilities.loggerUtilVoterRoll import logger
+
+# state file format version; bump when the record layout changes so old state is ignored
+STATE_VERSION = 1
+
+# load the per-county state of the previous run; a missing or unreadable state file means "process everything"
+def load_run_state(state_file: str) -> Dict[str, Dict[str, Any]]:
+    if not os.path.exists(state_file):
+        return {}
+    try:
+        with open(state_file, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("version") != STATE_VERSION:
+            logger.warning(f"WARNING: ignoring state file {state_file} with unsupported version {state.get('version')}")
+            return {}
+        return state.get("counties", {})
+    except Exception as e:
+        logger.warning(f"WARNING: ignoring unreadable state file {state_file}: {e}")
+        return {}
+
+# write the per-county state atomically, so an interrupted run never leaves a half-written state file
+def save_run_state(counties: Dict[str, Dict[str, Any]], state_file: str) -> None:
+    try:
+        with atomic_path(state_file) as tmp_path:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": STATE_VERSION, "counties": counties}, f, indent=2)
+        logger.info(f"Wrote run state {state_file}")
+    except Exception as e:
+        logger.error(f"ERROR: failed to write run state {state_file}: {e}")
+
+# fingerprint of file_path, reusing the previous content hash when path, size and modification time are unchanged
+# this keeps an incremental run from re-hashing every county's multi-hundred-MB inputs
+def quick_fingerprint(file_path: str, previous: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    if previous:
+        stat = os.stat(file_path)
+        if (previous.get("path")     == os.path.abspath(file_path) and
+            previous.get("size")     == stat.st_size               and
+            previous.get("mtime_ns") == stat.st_mtime_ns):
+            return dict(previous)
+    return file_fingerprint(file_path)
+
+# fingerprints of the inputs that determine a county's output
+def county_input_state(sub_dir_path: str, ncoa_file: str, vr_file: str, template_fingerprint: Dict[str, Any],
+                       previous: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    previous = previous or {}
+    return {
+        "ncoa_file":            ncoa_file,
+        "ncoa_fingerprint":     quick_fingerprint(os.path.join(sub_dir_path, ncoa_file), previous.get("ncoa_fingerprint")),
+        "vr_file":              vr_file,
+        "vr_fingerprint":       quick_fingerprint(os.path.join(sub_dir_path, vr_file),   previous.get("vr_fingerprint")),
+        "template_fingerprint": template_fingerprint,
+    }
+
+# True when the selected inputs, their contents, the voters_moved.xlsx template and the output file all match the previous run
+def county_unchanged(previous: Optional[Dict[str, Any]], current: Dict[str, Any]) -> bool:
+    if not previous:
+        return False
+    for key in ("ncoa_file", "vr_file"):
+        if previous.get(key) != current[key]:
+            return False
+    for key in ("ncoa_fingerprint", "vr_fingerprint", "template_fingerprint"):
+        if (previous.get(key) or {}).get("hash") != current[key]["hash"]:
+            return False
+
+    # outputs must still exist and be the files this tool wrote
+    previous_outputs: Dict[str, Dict[str, Any]] = previous.get("output_fingerprints") or {}
+    if not previous_outputs:
+        return False
+    for output_file, output_fingerprint in previous_outputs.items():
+        if not os.path.exists(output_file):
+            return False
+        if quick_fingerprint(output_file, output_fingerprint)["hash"] != output_fingerprint.get("hash"):
+            return False
+    return True
+
+# fingerprints of a county's output files, keyed by absolute path
+def output_fingerprints(*output_files: str) -> Dict[str, Dict[str, Any]]:
+    return {os.path.abspath(output_file): file_fingerprint(output_file) for output_file in output_files}
@@ -0,0 +1,123 @@
+# Standard library imports
+import os
+from   typing import Any, Dict, List
+
+# Third-party imports
+import pandas as pd
+from   pandas import DataFrame, Series
+
+# Local application/library specific imports
+from utilities.atomicFile          import atomic_path
+from utilities.excelFormatter      import write_sheets_workbook
+from utilities.instrumentation     import stage
+from utilities.loggerUtilVoterRoll import logger
+from utilities.matchEngine         import VR_VOTER_ID_COL
+
+# pyarrow is optional; without it the statewide dataset is written as CSV only
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+# columns added to the statewide dataset
+SOURCE_COUNTY_COL      = "SOURCE_COUNTY_DIR"   # county directory the row came from; the voter roll (VR) COUNTY column is kept as is
+COUNTY_COUNT_COL       = "COUNTY_COUNT"        # number of counties whose NCOA hits contain this VOTER_ID
+DUPLICATE_COUNTIES_COL = "DUPLICATE_COUNTIES"  # those counties, comma-separated, when there is more than one
+
+# statewide output file names, written to the colorado_voters_moved directory
+STATEWIDE_NAME = "colorado_voters_moved_statewide"
+
+# hashable key per voter id, so 123, 123.0 and '123' from differently typed county files compare equal
+def voter_id_keys(voter_ids: Series) -> Series:
+    numeric = pd.to_numeric(voter_ids, errors="coerce")
+    whole   = numeric.notna() & (numeric % 1 == 0)
+    keys    = voter_ids.astype(str).str.strip()
+    keys[whole] = numeric[whole].astype("int64").astype(str)
+    return keys
+
+# statewide dataset from the in-memory county frames, in county order, with a SOURCE_COUNTY_DIR column first
+# VOTER_IDs matched in more than one county are flagged with one hash-based group-by over (voter id, county) pairs,
+# never by comparing counties pairwise
+def build_statewide(county_frames: Dict[str, DataFrame]) -> DataFrame:
+    frames = [df.assign(**{SOURCE_COUNTY_COL: county}) for county, df in county_frames.items() if not df.empty]
+    if not frames:
+        return DataFrame(columns=[SOURCE_COUNTY_COL, COUNTY_COUNT_COL, DUPLICATE_COUNTIES_COL])
+    statewide_df: DataFrame = pd.concat(frames, ignore_index=True)
+    statewide_df = statewide_df[[SOURCE_COUNTY_COL] + [column for column in statewide_df.columns if column != SOURCE_COUNTY_COL]]
+
+    keys  = voter_id_keys(statewide_df[VR_VOTER_ID_COL])
+    pairs = DataFrame({"key": keys, "county": statewide_df[SOURCE_COUNTY_COL]}).drop_duplicates()
+    counts: Series = pairs.groupby("key", sort=False)["county"].size()
+    duplicates     = pairs[pairs["key"].map(counts) > 1]
+    duplicate_counties: Series = duplicates.groupby("key", sort=False)["county"].agg(", ".join)
+
+    statewide_df[COUNTY_COUNT_COL]       = keys.map(counts).astype("int64")
+    statewide_df[DUPLICATE_COUNTIES_COL] = keys.map(duplicate_counties).fillna("")
+    return statewide_df
+
+# write the statewide dataset to out_dir: CSV always, Parquet when pyarrow is installed,
+# and with xlsx a workbook with one formatted sheet per county; every file is written atomically
+# statewide files an earlier run wrote but this one did not are removed, so none of them is out of date
+# returns the paths written
+def write_statewide(statewide_df: DataFrame, out_dir: str, xlsx: bool = False, name: str = STATEWIDE_NAME) -> List[str]:
+    files: List[str] = []
+    csv_file = os.path.join(out_dir, f"{name}.csv")
+    with stage("statewide_csv", rows=len(statewide_df)), atomic_path(csv_file) as tmp_path:
+        statewide_df.to_csv(tmp_path, index=False)
+    files.append(csv_file)
+
+    if pyarrow is not None:
+        parquet_file = os.path.join(out_dir, f"{name}.parquet")
+        with stage("statewide_parquet", rows=len(statewide_df)), atomic_path(parquet_file) as tmp_path:
+            # object columns can mix numbers and text across counties; Parquet needs one type per column
+            statewide_df.astype({column: "string" for column in statewide_df.columns if statewide_df[column].dtype == object}).to_parquet(tmp_path, index=False)
+        files.append(parquet_file)
+    else:
+        logger.info("pyarrow is not installed; statewide dataset written as CSV only.")
+
+    if xlsx and not statewide_df.empty:
+        xlsx_file = os.path.join(out_dir, f"{name}.xlsx")
+        sheets = {county: df.drop(columns=SOURCE_COUNTY_COL) for county, df in statewide_df.groupby(SOURCE_COUNTY_COL, sort=False)}
+        with stage("statewide_xlsx", rows=len(statewide_df)), atomic_path(xlsx_file) as tmp_path:
+            write_sheets_workbook(sheets, tmp_path)
+        files.append(xlsx_file)
+
+    for extension in (".parquet", ".xlsx"):
+        stale_file = os.path.join(out_dir, f"{name}{extension}")
+        if stale_file in files or not os.path.exists(stale_file):
+            continue
+        try:
+            os.remove(stale_file)
+            logger.info(f"Removed {stale_file} from an earlier run.")
+        except OSError as e:  # still open in Excel on Windows
+            logger.warning(f"WARNING: could not remove {stale_file} from an earlier run; it is out of date: {e}")
+    return files
+
+# rows of the previous statewide CSV for the given counties
+# incremental runs hold no frame for unchanged counties; their rows are carried over from the last statewide dataset
+def previous_statewide_rows(out_dir: str, counties: List[str], name: str = STATEWIDE_NAME) -> Dict[str, DataFrame]:
+    csv_file = os.path.join(out_dir, f"{name}.csv")
+    if not counties:
+        return {}
+    if not os.path.exists(csv_file):
+        logger.warning(f"WARNING: {csv_file} not found; unchanged counties are missing from the statewide dataset.")
+        return {}
+    try:
+        previous_df = pd.read_csv(csv_file, dtype=str, keep_default_na=False)
+    except Exception as e:
+        logger.warning(f"WARNING: unreadable statewide dataset {csv_file}; unchanged counties are missing from it: {e}")
+        return {}
+    if SOURCE_COUNTY_COL not in previous_df.columns:  # written before SOURCE_COUNTY_DIR was added
+        logger.warning(f"WARNING: {csv_file} has no {SOURCE_COUNTY_COL} column; unchanged counties are missing from the statewide dataset.")
+        return {}
+    previous_df = previous_df.drop(columns=[COUNTY_COUNT_COL, DUPLICATE_COUNTIES_COL], errors="ignore")
+    return {county: df.drop(columns=SOURCE_COUNTY_COL) for county, df in previous_df.groupby(SOURCE_COUNTY_COL, sort=False) if county in counties}
+
+# log a statewide summary and return it for the run manifest
+def statewide_summary(statewide_df: DataFrame, files: List[str]) -> Dict[str, Any]:
+    duplicate_ids = 0
+    if not statewide_df.empty:
+        duplicate_ids = int(voter_id_keys(statewide_df.loc[statewide_df[COUNTY_COUNT_COL] > 1, VR_VOTER_ID_COL]).nunique())
+    summary: Dict[str, Any] = {"rows": len(statewide_df), "duplicate_voter_ids": duplicate_ids, "files": files}
+    logger.info(f"Statewide dataset: {len(statewide_df)} rows, {duplicate_ids} VOTER_IDs matched in more than one county")
+    return summary
@@ -0,0 +1,83 @@
+# Standard library imports
+import os
+from   typing import Any, Dict, Optional, Tuple
+
+# Third-party imports
+import numpy  as np
+import pandas as pd
+from   pandas import DataFrame, Series
+
+# Local application/library specific imports
+from utilities.atomicFile          import atomic_path
+from utilities.loggerUtilVoterRoll import logger
+from utilities.matchEngine         import VR_VOTER_ID_COL, VoterIdIndex
+from utilities.voterSchema         import format_output_dates
+
+# column added to delta reports: "added" or "removed"
+CHANGE_COL = "CHANGE"
+
+# matched VOTER_ID snapshot of a county, kept between runs
+def snapshot_path(trend_dir: str, county: str) -> str:
+    return os.path.join(trend_dir, f"{county}_voter_ids.npz")
+
+# sorted unique voter ids as a compact array: int64 when every id is a whole number, text otherwise
+def voter_id_array(voter_ids: Series) -> np.ndarray:
+    voter_ids = voter_ids.dropna()
+    if pd.api.types.is_integer_dtype(voter_ids.dtype):
+        return np.unique(voter_ids.to_numpy(dtype="int64"))
+    return np.unique(voter_ids.astype(str).to_numpy(dtype=str))
+
+# previous snapshot of a county: (sorted voter ids, NCOA file they were matched from), or None before the first trend run
+def load_snapshot(file_path: str) -> Optional[Tuple[np.ndarray, str]]:
+    if not os.path.exists(file_path):
+        return None
+    try:
+        with np.load(file_path, allow_pickle=False) as snapshot:
+            return snapshot["voter_ids"], str(snapshot["ncoa_file"])
+    except Exception as e:
+        logger.warning(f"WARNING: ignoring unreadable trend snapshot {file_path}: {e}")
+        return None
+
+# write a county snapshot atomically
+def save_snapshot(file_path: str, voter_ids: np.ndarray, ncoa_file: str) -> None:
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with atomic_path(file_path) as tmp_path:
+        with open(tmp_path, "wb") as f:  # a file object, so numpy does not append .npz to the temporary name
+            np.savez(f, voter_ids=voter_ids, ncoa_file=np.array(ncoa_file))
+
+# voter ids added and removed since the previous snapshot; both inputs are sorted and unique, so this is a linear merge
+def diff_ids(previous: np.ndarray, current: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    if previous.dtype.kind != current.dtype.kind:  # ids switched between numbers and text: compare as text
+        previous, current = np.unique(previous.astype(str)), np.unique(current.astype(str))
+    return np.setdiff1d(current, previous, assume_unique=True), np.setdiff1d(previous, current, assume_unique=True)
+
+# True where a voter id is in ids (a voter_id_array)
+def _in_ids(voter_ids: Series, ids: np.ndarray) -> Series:
+    return voter_ids.astype(str).isin(ids) if ids.dtype.kind == "U" else voter_ids.isin(ids)
+
+# current voter roll (VR) rows of removed voters, dates formatted for output; voters no longer in the VR get a row with just their VOTER_ID
+# looked up while the VR is still loaded, so it can be freed before the outputs are formatted
+def removed_voter_rows(index: VoterIdIndex, removed: np.ndarray) -> DataFrame:
+    removed_rows = format_output_dates(index.lookup(removed))
+    found        = voter_id_array(removed_rows[VR_VOTER_ID_COL])
+    missing      = np.setdiff1d(removed, found.astype(str) if removed.dtype.kind == "U" else found, assume_unique=True)
+    if len(missing):
+        removed_rows = pd.concat([removed_rows, DataFrame({VR_VOTER_ID_COL: missing})], ignore_index=True)
+    return removed_rows
+
+# delta report: output rows of added voters, then the rows of removed voters, with CHANGE as the first column
+def delta_frame(county_df: DataFrame, added: np.ndarray, removed_rows: DataFrame) -> DataFrame:
+    added_rows = county_df[_in_ids(county_df[VR_VOTER_ID_COL], added)]
+    delta_df   = pd.concat([added_rows.assign(**{CHANGE_COL: "added"}), removed_rows.assign(**{CHANGE_COL: "removed"})], ignore_index=True)
+    columns    = [CHANGE_COL] + [column for column in county_df.columns if column != CHANGE_COL]
+    return delta_df.reindex(columns=columns)
+
+# trend summary for the run manifest
+def trend_summary(previous: Optional[Tuple[np.ndarray, str]], current: np.ndarray, added: np.ndarray, removed: np.ndarray) -> Dict[str, Any]:
+    return {
+        "previous_ncoa_file": previous[1] if previous else None,
+        "previous":           len(previous[0]) if previous else 0,
+        "current":            len(current),
+        "added":              len(added),
+        "removed":            len(removed),
+    }
@@ -0,0 +1,120 @@
+# Standard library imports
+from   typing import Any, Dict, List, Optional
+
+# Third-party imports
+import pandas as pd
+from   pandas import DataFrame, Series
+
+# Local application/library specific imports
+from utilities.inputReader         import read_input_file
+from utilities.loggerUtilVoterRoll import logger
+from utilities.matchEngine         import NCOA_STATE_COL, NCOA_VOTER_ID_COL, VR_VOTER_ID_COL
+
+# schema version; part of the input cache key, so cached frames are re-read when the schema changes
+SCHEMA_VERSION = 2
+
+# voter roll (VR) columns of whole numbers, typed as integers whatever the input format (Excel reads them as numbers, CSV as text)
+VR_INTEGER_COLUMNS: List[str] = [
+    VR_VOTER_ID_COL, "COUNTY_CODE", "PRECINCT_NAME", "ADDRESS_LIBRARY_ID", "HOUSE_NUM", "RESIDENTIAL_ZIP_CODE", "BIRTH_YEAR", "PRECINCT",
+    "CONGRESSIONAL", "STATE_SENATE", "STATE_HOUSE",
+]
+
+# voter roll (VR) columns with a small set of repeated values, held as categoricals
+VR_CATEGORY_COLUMNS: List[str] = [
+    "COUNTY_CODE", "COUNTY", "STATUS_CODE", "NAME_SUFFIX", "HOUSE_SUFFIX", "PRE_DIR", "STREET_TYPE", "POST_DIR", "UNIT_TYPE",
+    "RESIDENTIAL_CITY", "RESIDENTIAL_STATE", "STATUS", "STATUS_REASON", "BIRTH_YEAR", "GENDER", "PARTY", "PREFERENCE",
+    "MAILING_CITY", "MAILING_STATE", "MAILING_COUNTRY", "PERMANENT_MAIL_IN_VOTER", "CONGRESSIONAL", "STATE_SENATE", "STATE_HOUSE",
+    "ID_REQUIRED", "AVR",
+]
+
+# voter roll (VR) date columns, parsed at read time and formatted once when the output is written
+VR_DATE_COLUMNS: List[str] = ["EFFECTIVE_DATE", "REGISTRATION_DATE", "PARTY_AFFILIATION_DATE"]
+
+# date format of the output workbooks
+OUTPUT_DATE_FORMAT = "%m/%d/%Y"
+
+# whole numbers as integers, value by value like Excel cells: a column of whole numbers becomes nullable Int64;
+# a column with other values (e.g. house number 3A) holds its whole numbers as ints and keeps the other values as read,
+# so the result does not depend on how a CSV is split into chunks
+def whole_numbers(values: Series) -> Series:
+    if pd.api.types.is_integer_dtype(values.dtype):
+        return values.astype("Int64")
+    numeric = pd.to_numeric(values, errors="coerce")
+    whole   = numeric.notna() & (numeric % 1 == 0)
+    if whole.sum() == values.notna().sum():
+        return numeric.astype("Int64")
+    return numeric.where(whole).astype("Int64").astype(object).where(whole, values)
+
+# whole_numbers for a column of a whole file, with one warning when it kept values that are not whole numbers
+def _integer_column(values: Series) -> Series:
+    typed = whole_numbers(values)
+    if typed.dtype == object:
+        logger.warning(f"WARNING: {values.name} has values that are not whole numbers; they are kept as read.")
+    return typed
+
+# dates parsed per value, so one voter roll can mix layouts such as 2024-01-31 and 01/31/2024
+# values that are not dates become empty (NaT) with a warning, rather than failing the county
+def parse_dates(values: Series) -> Series:
+    if pd.api.types.is_datetime64_any_dtype(values.dtype):
+        return values
+    dates = pd.to_datetime(values, errors="coerce", format="mixed")
+    unparsed = int((dates.isna() & values.notna()).sum())
+    if unparsed:
+        logger.warning(f"WARNING: {unparsed} {values.name} value(s) could not be read as dates; left empty.")
+    return dates
+
+# VR_INTEGER_COLUMNS through whole_numbers; applied to each CSV chunk as it is read, so it does not warn (apply_vr_schema does, once)
+def vr_integer_columns(vr_df: DataFrame) -> DataFrame:
+    return vr_df.assign(**{column: whole_numbers(vr_df[column]) for column in VR_INTEGER_COLUMNS if column in vr_df.columns})
+
+# categorical copy of a column; values keep the type they were read with, so numeric Excel cells stay numbers in the output
+def _category(values: Series) -> Series:
+    return values if isinstance(values.dtype, pd.CategoricalDtype) else values.astype("category")
+
+# typed voter roll (VR) frame: integer columns, categorical low-cardinality columns and parsed dates
+# read_vr_file has already typed the integer columns (per CSV chunk); here they are checked once for the warning
+# columns missing from a file are left out; other columns keep their types
+def apply_vr_schema(vr_df: DataFrame) -> DataFrame:
+    typed: Dict[str, Series] = {}
+    for column in VR_INTEGER_COLUMNS:
+        if column in vr_df.columns:
+            typed[column] = _integer_column(vr_df[column])
+    for column in VR_CATEGORY_COLUMNS:
+        if column in vr_df.columns:
+            typed[column] = _category(typed.get(column, vr_df[column]))
+    for column in VR_DATE_COLUMNS:
+        if column in vr_df.columns:
+            typed[column] = parse_dates(vr_df[column])
+    return vr_df.assign(**typed)
+
+# typed NCOA frame: integer VoterID and categorical NEW State
+def apply_ncoa_schema(ncoa_df: DataFrame) -> DataFrame:
+    typed: Dict[str, Series] = {}
+    if NCOA_VOTER_ID_COL in ncoa_df.columns:
+        typed[NCOA_VOTER_ID_COL] = _integer_column(ncoa_df[NCOA_VOTER_ID_COL])
+    if NCOA_STATE_COL in ncoa_df.columns:
+        typed[NCOA_STATE_COL] = _category(ncoa_df[NCOA_STATE_COL])
+    return ncoa_df.assign(**typed)
+
+# typed readers for the input cache; schema only keys the cache entry
+def read_vr_file(file_path: str, columns: Optional[List[str]] = None, schema: int = SCHEMA_VERSION) -> DataFrame:
+    return apply_vr_schema(read_input_file(file_path, columns=columns, convert=vr_integer_columns))
+
+def read_ncoa_file(file_path: str, columns: Optional[List[str]] = None, schema: int = SCHEMA_VERSION) -> DataFrame:
+    return apply_ncoa_schema(read_input_file(file_path, columns=columns))
+
+# matched records laid out like the voters_moved.xlsx template: template columns first, then any other VR columns
+# concatenating onto the empty template would turn every column into object; reindexing keeps the typed columns
+def conform_to_template(template_df: DataFrame, records: DataFrame) -> DataFrame:
+    if not template_df.empty:
+        return pd.concat([template_df, records], ignore_index=True)
+    columns = list(template_df.columns) + [column for column in records.columns if column not in template_df.columns]
+    return records.reindex(columns=columns)
+
+# output boundary: dates as MM/DD/YYYY text, one pass per date column
+def format_output_dates(df: DataFrame) -> DataFrame:
+    formatted: Dict[str, Any] = {}
+    for column in VR_DATE_COLUMNS:
+        if column in df.columns:
+            formatted[column] = parse_dates(df[column]).dt.strftime(OUTPUT_DATE_FORMAT)
+    return df.assign(**formatted)